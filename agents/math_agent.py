@@ -1,7 +1,9 @@
-import google.generativeai as genai
 import json
+from typing import Any, AsyncIterator, Dict
 import re  # Make sure re is imported
-from core.base_agent import BaseAgent, AgentType, AgentMessage, AgentContext
+from core.base_agent import BaseAgent, AgentType, AgentMessage, AgentContext, stream_event, collect_response
+from core.query_features import QueryFeatures, feature_extractor
+from core.llm_client import LLMUnavailableError
 from tools.calculator_tool import CalculatorTool
 from tools.graphing_tool import GraphingTool
 from tools.equation_solver_tool import EquationSolverTool
@@ -10,7 +12,7 @@ from config.settings import settings
 class MathAgent(BaseAgent):
     def __init__(self):
         super().__init__("math_001", AgentType.SPECIALIST, "Mathematics Expert")
-        self.model = genai.GenerativeModel('gemini-2.0-flash-exp')
+        self.model_name = 'gemini-2.0-flash-exp'
         
         # Add mathematical tools
         self.add_tool(CalculatorTool())
@@ -21,46 +23,55 @@ class MathAgent(BaseAgent):
             "algebra", "calculus", "geometry", "statistics", 
             "equations", "graphing", "calculations"
         ]
-    
-    def can_handle(self, query: str) -> float:
-        math_indicators = [
+        
+        # Keyword tables matched once per query by the shared feature extractor
+        feature_extractor.register("math:indicators", [
             "solve", "calculate", "equation", "derivative", "integral",
             "graph", "plot", "algebra", "geometry", "trigonometry"
-        ]
-        
-        query_lower = query.lower()
-        matches = sum(1 for indicator in math_indicators if indicator in query_lower)
-        return min(matches * 0.3, 1.0)
+        ])
+        feature_extractor.register("math:equation_solving", ['solve', 'equation', 'find x', 'find the value'])
+        feature_extractor.register("math:graphing", [
+            'graph', 'plot', 'visualize', 'draw', 'show the function', 
+            'display function', 'show f(x)', 'plot f(x)'
+        ])
+        feature_extractor.register("math:calculation", ['+', '-', '*', '/', '=', 'calculate'])
+        feature_extractor.register("math:solving", ['solve', 'equation', 'find x'])
+        feature_extractor.register("math:plot_3d", ['3d', 'surface', 'three dimensional'])
+        feature_extractor.register("math:plot_2d", ['2d', 'plane', 'two dimensional'])
+    
+    def can_handle(self, query: str, features: QueryFeatures = None) -> float:
+        features = features or feature_extractor.extract(query)
+        return min(features.count("math:indicators") * 0.3, 1.0)
     
     async def process(self, message: AgentMessage, context: AgentContext) -> str:
+        return await collect_response(self.process_stream(message, context))
+    
+    async def process_stream(self, message: AgentMessage, context: AgentContext) -> AsyncIterator[Dict[str, Any]]:
         query = message.content
+        features = self.get_features(query, context)
         
         # Special handling for equation solving
-        is_equation_solving = any(phrase in query.lower() for phrase in [
-            'solve', 'equation', 'find x', 'find the value'
-        ])
+        is_equation_solving = features.has("math:equation_solving")
         
+        solve_outcome = None
         if is_equation_solving:
-            try:
-                # Use equation solver tool directly
-                solution = await self.use_tool("equation_solver", equation=query)
+            # Use equation solver tool directly
+            solve_outcome = await self.run_tool("equation_solver", {"equation": query}, context)
+            
+            # Continue with regular processing if direct solving fails
+            if solve_outcome.ok:
+                solution = solve_outcome.result
+                yield stream_event("tool", tool="equation_solver", result=solution)
                 
-                # Return a clear, concise response for equation solving
-                if "x =" in solution:
-                    # Extract just the solution part for a cleaner response
-                    if "\n\nSteps:" in solution:
-                        solution_part, steps_part = solution.split("\n\nSteps:", 1)
-                        return f"{solution_part}\n\nSteps:{steps_part}"
-                    return solution
-            except Exception as e:
-                # Continue with regular processing if direct solving fails
-                pass
+                # A solved equation with its steps needs no model explanation
+                answer = self.tool_answer(query, [("equation_solver", solution)])
+                if answer:
+                    self.record_answer_path("tool")
+                    yield stream_event("final", response=answer)
+                    return
         
         # Check if this is a graphing request
-        is_graphing_request = any(phrase in query.lower() for phrase in [
-            'graph', 'plot', 'visualize', 'draw', 'show the function', 
-            'display function', 'show f(x)', 'plot f(x)'
-        ])
+        is_graphing_request = features.has("math:graphing")
         
         # For graphing requests, simplify the response and prioritize the graph
         if is_graphing_request:
@@ -69,15 +80,19 @@ class MathAgent(BaseAgent):
                 function_str = query
                 
                 # Generate the graph directly
-                graph_result = await self.use_tool("graphing", function=function_str)
+                graph_outcome = await self.run_tool("graphing", {"function": function_str}, context)
+                graph_result = graph_outcome.result if graph_outcome.ok else ""
                 
                 # For graphing requests, return a simple response with the graph
                 if '<plotly-graph>' in graph_result:
+                    yield stream_event("tool", tool="graphing", result=graph_result)
+                    
                     # Extract the function expression
                     match = re.search(r'f\s*\(\s*x\s*\)\s*=\s*([^,.;]+)', query)
                     function_expr = match.group(0) if match else query
                     
-                    return f"Here's the graph of {function_expr}:\n\n{graph_result}"
+                    yield stream_event("final", response=f"Here's the graph of {function_expr}:\n\n{graph_result}")
+                    return
                 else:
                     # If there was an error, fall back to regular processing
                     pass
@@ -86,14 +101,11 @@ class MathAgent(BaseAgent):
                 pass
         
         # Check if this is specifically a graphing request
-        is_primarily_graphing = any(phrase in query.lower() for phrase in [
-            'graph', 'plot', 'visualize', 'draw', 'show the function', 
-            'display function', 'show f(x)', 'plot f(x)'
-        ])
+        is_primarily_graphing = is_graphing_request
         
         # Extract other needs
-        needs_calculation = any(op in query for op in ['+', '-', '*', '/', '=', 'calculate'])
-        needs_solving = any(word in query.lower() for word in ['solve', 'equation', 'find x'])
+        needs_calculation = features.has("math:calculation")
+        needs_solving = features.has("math:solving")
         
         tool_results = []
         graph_result = None
@@ -103,12 +115,13 @@ class MathAgent(BaseAgent):
             try:
                 # Determine if it's a 2D or 3D graph request
                 plot_type = "auto"
-                if any(term in query.lower() for term in ['3d', 'surface', 'three dimensional']):
+                if features.has("math:plot_3d"):
                     plot_type = "3d"
-                elif any(term in query.lower() for term in ['2d', 'plane', 'two dimensional']):
+                elif features.has("math:plot_2d"):
                     plot_type = "2d"
                     
-                graph_result = await self.use_tool("graphing", function=query, plot_type=plot_type)
+                graph_outcome = await self.run_tool("graphing", {"function": query, "plot_type": plot_type}, context)
+                graph_result = graph_outcome.result if graph_outcome.ok else None
                 
                 # For primarily graphing requests, return just the graph with minimal text
                 if isinstance(graph_result, dict) and "type" in graph_result:
@@ -120,28 +133,53 @@ class MathAgent(BaseAgent):
                     
                     # Only if another tool is needed, add more explanation
                     if needs_calculation or needs_solving:
-                        return await self._generate_full_response(query, [brief_response])
+                        async for event in self._stream_full_response(query, [brief_response], context):
+                            yield event
+                        return
                     
-                    return brief_response
+                    yield stream_event("final", response=brief_response)
+                    return
             except Exception as e:
                 import traceback
                 error_details = traceback.format_exc()
                 tool_results.append(f"Graphing error: {str(e)}")
         
-        # Handle other tools if needed
+        # Handle other tools if needed, running the independent ones concurrently
+        tool_calls = []
         if needs_calculation:
-            try:
-                calc_result = await self.use_tool("calculator", expression=query)
-                tool_results.append(f"Calculation result: {calc_result}")
-            except Exception as e:
-                tool_results.append(f"Calculation error: {str(e)}")
-        
-        if needs_solving:
-            try:
-                solve_result = await self.use_tool("equation_solver", equation=query)
-                tool_results.append(f"Solution: {solve_result}")
-            except Exception as e:
-                tool_results.append(f"Equation solving error: {str(e)}")
+            tool_calls.append(("calculator", {"expression": query}))
+        # Reuse the direct solve attempt above instead of solving the same equation twice; a solve
+        # that reported no solution won't find one on the second try either
+        if needs_solving and not (solve_outcome and (solve_outcome.ok or solve_outcome.declined)):
+            tool_calls.append(("equation_solver", {"equation": query}))
+        
+        results_by_tool = {}
+        declined = set()
+        if solve_outcome and solve_outcome.ok and needs_solving:
+            results_by_tool["equation_solver"] = solve_outcome.result
+        async for outcome in self.fan_out_tools(tool_calls, context):
+            # Slow or failed tools are dropped from the prompt context
+            if outcome.ok:
+                results_by_tool[outcome.name] = outcome.result
+                yield stream_event("tool", tool=outcome.name, result=outcome.result,
+                                   latency_ms=round(outcome.latency * 1000, 1))
+            elif outcome.declined:
+                declined.add(outcome.name)
+        
+        # Skip the model when every tool that ran, including the direct solve above, fully answers
+        # the query (e.g. bare arithmetic) or reported that it did not apply
+        if (tool_calls and not graph_result and results_by_tool
+                and all(name in results_by_tool or name in declined for name, _ in tool_calls)):
+            answer = self.tool_answer(query, list(results_by_tool.items()))
+            if answer:
+                self.record_answer_path("tool")
+                yield stream_event("final", response=answer)
+                return
+        
+        if "calculator" in results_by_tool:
+            tool_results.append(f"Calculation result: {results_by_tool['calculator']}")
+        if "equation_solver" in results_by_tool:
+            tool_results.append(f"Solution: {results_by_tool['equation_solver']}")
         
         # If we're here and have a graph result but not a primarily graphing request
         if graph_result and not is_primarily_graphing:
@@ -151,7 +189,8 @@ class MathAgent(BaseAgent):
                 tool_results.append(f"Graph generated: {graph_result}")
         
         # Generate response with Gemini for non-graph focused requests
-        return await self._generate_full_response(query, tool_results)
+        async for event in self._stream_full_response(query, tool_results, context):
+            yield event
     
     def _extract_function(self, query: str) -> str:
         """Extract the function expression from the query"""
@@ -173,13 +212,18 @@ class MathAgent(BaseAgent):
         # Default
         return query.strip()
     
-    async def _generate_full_response(self, query: str, tool_results: list) -> str:
+    def _tool_only_response(self, tool_results: list) -> str:
+        if not tool_results:
+            return "Detailed explanations are temporarily unavailable. Please try again in a moment."
+        return "Here are the computed results (detailed explanations are temporarily unavailable):\n\n" + "\n".join(tool_results)
+    
+    async def _stream_full_response(self, query: str, tool_results: list, context: AgentContext = None) -> AsyncIterator[Dict[str, Any]]:
         # Create a prompt that requests a concise response
         tool_context = "\n".join(tool_results) if tool_results else "No tools were used."
         
         math_prompt = f"""
         You are a mathematics expert. Answer this math question concisely.
-        
+        {self.conversation_block(context)}
         Question: {query}
         Tool Results: {tool_context}
         
@@ -187,15 +231,24 @@ class MathAgent(BaseAgent):
         Keep explanations short and to the point. If there's a graph or calculation result, highlight that.
         """
         
+        self.record_answer_path("llm")
         try:
-            response = self.model.generate_content(math_prompt)
+            chunks = []
+            async for chunk in self.generate_stream(
+                math_prompt, context, cache_key=self.cache_key("explain", query, tool_results, context)
+            ):
+                chunks.append(chunk)
+                yield stream_event("token", text=chunk)
             
-            final_response = response.text
+            final_response = "".join(chunks)
             if tool_results:
                 # If the response already includes the tool results, don't append them again
                 if not any(result in final_response for result in tool_results):
                     final_response += f"\n\n{chr(10).join(tool_results)}"
             
-            return final_response
+            yield stream_event("final", response=final_response)
+        except LLMUnavailableError:
+            # Model backend is unhealthy: answer deterministically from the tools alone
+            yield stream_event("final", response=self._tool_only_response(tool_results))
         except Exception as e:
-            return f"I apologize, but I encountered an error solving this math problem: {str(e)}"
+            yield stream_event("final", response=f"I apologize, but I encountered an error solving this math problem: {str(e)}")
@@ -1,6 +1,8 @@
-import google.generativeai as genai
 import re  # Add missing import
-from core.base_agent import BaseAgent, AgentType, AgentMessage, AgentContext
+from typing import Any, AsyncIterator, Dict
+from core.base_agent import BaseAgent, AgentType, AgentMessage, AgentContext, stream_event, collect_response
+from core.query_features import QueryFeatures, feature_extractor
+from core.llm_client import LLMUnavailableError
 from tools.physics_constants_tool import PhysicsConstantsTool
 from tools.unit_converter_tool import UnitConverterTool
 from tools.physics_calculator_tool import PhysicsCalculatorTool
@@ -9,64 +11,92 @@ from config.settings import settings
 class PhysicsAgent(BaseAgent):
     def __init__(self):
         super().__init__("physics_001", AgentType.SPECIALIST, "Physics Expert")
-        self.model = genai.GenerativeModel('gemini-2.0-flash-exp')
+        self.model_name = 'gemini-2.0-flash-exp'
         
         # Add physics tools
         self.add_tool(PhysicsConstantsTool())
         self.add_tool(UnitConverterTool())
         self.add_tool(PhysicsCalculatorTool())
         
+        self.tool_labels = {
+            "physics_constants": "Constants",
+            "unit_converter": "Conversion",
+            "physics_calculator": "Calculation"
+        }
+        
         self.capabilities = [
             "mechanics", "thermodynamics", "electromagnetism", 
             "quantum", "constants", "unit_conversion"
         ]
-    
-    def can_handle(self, query: str) -> float:
-        physics_indicators = [
+        
+        # Keyword tables matched once per query by the shared feature extractor
+        feature_extractor.register("physics:indicators", [
             "force", "velocity", "acceleration", "energy", "momentum",
             "newton", "einstein", "quantum", "electromagnetic", "gravity"
-        ]
-        
-        query_lower = query.lower()
-        matches = sum(1 for indicator in physics_indicators if indicator in query_lower)
-        return min(matches * 0.4, 1.0)
+        ])
+        feature_extractor.register("physics:constants", ['constant', 'speed of light', 'planck', 'gravity'])
+        feature_extractor.register("physics:conversion", ['convert', 'unit', 'meter', 'kilogram'])
+        feature_extractor.register("physics:calculation", ['calculate', 'find', 'formula'])
+    
+    def can_handle(self, query: str, features: QueryFeatures = None) -> float:
+        features = features or feature_extractor.extract(query)
+        return min(features.count("physics:indicators") * 0.4, 1.0)
     
     async def process(self, message: AgentMessage, context: AgentContext) -> str:
+        return await collect_response(self.process_stream(message, context))
+    
+    async def process_stream(self, message: AgentMessage, context: AgentContext) -> AsyncIterator[Dict[str, Any]]:
         query = message.content
+        features = self.get_features(query, context)
         
         try:
-            tool_results = []
+            tool_calls = []
             
             # Check for constants lookup
-            if any(word in query.lower() for word in ['constant', 'speed of light', 'planck', 'gravity']):
-                try:
-                    constants_result = await self.use_tool("physics_constants", query=query)
-                    tool_results.append(f"Constants: {constants_result}")
-                except:
-                    pass
+            if features.has("physics:constants"):
+                tool_calls.append(("physics_constants", {"query": query}))
             
             # Check for unit conversion
-            if any(word in query.lower() for word in ['convert', 'unit', 'meter', 'kilogram']):
-                try:
-                    conversion_result = await self.use_tool("unit_converter", query=query)
-                    tool_results.append(f"Conversion: {conversion_result}")
-                except:
-                    pass
+            if features.has("physics:conversion"):
+                tool_calls.append(("unit_converter", {"query": query}))
             
             # Check for physics calculations
-            if any(word in query.lower() for word in ['calculate', 'find', 'formula']):
-                try:
-                    calc_result = await self.use_tool("physics_calculator", problem=query)
-                    tool_results.append(f"Calculation: {calc_result}")
-                except:
-                    pass
+            if features.has("physics:calculation"):
+                tool_calls.append(("physics_calculator", {"problem": query}))
+            
+            # Independent tools run concurrently; slow or failed ones are left out of the prompt
+            results_by_tool = {}
+            declined = set()
+            async for outcome in self.fan_out_tools(tool_calls, context):
+                if outcome.ok:
+                    results_by_tool[outcome.name] = outcome.result
+                    yield stream_event("tool", tool=outcome.name, result=outcome.result,
+                                       latency_ms=round(outcome.latency * 1000, 1))
+                elif outcome.declined:
+                    declined.add(outcome.name)
+            
+            # Lookups, conversions and formula results that fully answer the query skip the model;
+            # tools that reported they did not apply don't stand in the way, slow or broken ones do
+            if results_by_tool and all(name in results_by_tool or name in declined for name, _ in tool_calls):
+                answer = self.tool_answer(query, [(name, results_by_tool[name]) for name, _ in tool_calls
+                                                  if name in results_by_tool])
+                if answer:
+                    self.record_answer_path("tool")
+                    yield stream_event("final", response=answer)
+                    return
+            
+            # Keep the prompt order stable regardless of completion order
+            tool_results = [
+                f"{self.tool_labels[name]}: {results_by_tool[name]}"
+                for name, _ in tool_calls if name in results_by_tool
+            ]
             
             tool_context = "\n".join(tool_results) if tool_results else "No tools were used."
             
             # Modified prompt for brief, focused explanations
             physics_prompt = f"""
             You are a physics expert. Answer this physics question concisely.
-            
+            {self.conversation_block(context)}
             Question: {query}
             Tool Results: {tool_context}
             
@@ -79,21 +109,36 @@ class PhysicsAgent(BaseAgent):
             Use formulas where appropriate but keep explanations minimal.
             """
             
+            self.record_answer_path("llm")
             try:
-                response = self.model.generate_content(physics_prompt)
+                chunks = []
+                async for chunk in self.generate_stream(
+                    physics_prompt, context, cache_key=self.cache_key("explain", query, tool_results, context)
+                ):
+                    chunks.append(chunk)
+                    yield stream_event("token", text=chunk)
                 
                 # Process the response to be more concise
-                final_response = self._format_concise_response(response.text, tool_results)
+                final_response = self._format_concise_response("".join(chunks), tool_results)
                 
-                return final_response
+                yield stream_event("final", response=final_response)
+            except LLMUnavailableError:
+                # Model backend is unhealthy: answer deterministically from the tools alone
+                yield stream_event("final", response=self._tool_only_response(tool_results))
             except Exception as e:
                 # Return user-friendly error instead of technical details
-                return "I couldn't answer that physics question properly. Can you try rephrasing it?"
+                yield stream_event("final", response="I couldn't answer that physics question properly. Can you try rephrasing it?")
                 
         except Exception as e:
             # Catch-all error handling to prevent technical errors in frontend
-            return "I had trouble processing your physics question. Please try asking in a different way."
+            yield stream_event("final", response="I had trouble processing your physics question. Please try asking in a different way.")
 
+    def _tool_only_response(self, tool_results: list) -> str:
+        results = [result for result in tool_results if "error" not in result.lower()]
+        if not results:
+            return "Detailed physics explanations are temporarily unavailable. Please try again in a moment."
+        return "**Results:**\n" + "\n".join(results) + "\n\n_Detailed explanations are temporarily unavailable._"
+    
     def _format_concise_response(self, text: str, tool_results: list) -> str:
         """Format the response to be more concise by limiting paragraphs and adding tool results."""
         try:
@@ -1,16 +1,21 @@
-import google.generativeai as genai
-from core.base_agent import BaseAgent, AgentType, AgentMessage, AgentContext
-from typing import Dict, List
+from core.base_agent import (
+    BaseAgent, AgentType, AgentMessage, AgentContext, stream_event, collect_response, with_deadline
+)
+from core.query_features import QueryFeatures, feature_extractor
+from core.singleflight import SingleFlight
+from core.llm_client import LLMUnavailableError
+from core.tracing import tracer
+from typing import Any, AsyncIterator, Dict, List, Optional
 import re
 from config.settings import settings
 
-genai.configure(api_key=settings.gemini_api_key)
-
 class TutorAgent(BaseAgent):
     def __init__(self):
         super().__init__("tutor_001", AgentType.ORCHESTRATOR, "AI Tutor")
-        self.model = genai.GenerativeModel('gemini-2.0-flash')
+        self.model_name = 'gemini-2.0-flash'
         self.specialist_agents: Dict[str, BaseAgent] = {}
+        # Identical queries in flight at the same time share one computation
+        self.inflight = SingleFlight()
         
         # Subject classification keywords
         self.subject_keywords = {
@@ -23,52 +28,91 @@ class TutorAgent(BaseAgent):
             "history": ["history", "war", "civilization", "empire", "revolution", "century", "ancient", "medieval"],
             "geography": ["geography", "continent", "country", "climate", "mountain", "river", "population"]
         }
+        for subject, keywords in self.subject_keywords.items():
+            feature_extractor.register(f"subject:{subject}", keywords)
+        feature_extractor.register("tutor:graphing", [
+            'graph', 'plot', 'visualize', 'draw', 'show the function', 'display'
+        ])
     
     def register_specialist(self, subject: str, agent: BaseAgent):
         self.specialist_agents[subject] = agent
     
-    async def classify_query(self, query: str) -> str:
+    async def classify_query(self, query: str, features: Optional[QueryFeatures] = None,
+                             context: Optional[AgentContext] = None) -> str:
         # First try keyword matching
-        query_lower = query.lower()
+        features = features or feature_extractor.extract(query)
         subject_scores = {}
         
-        for subject, keywords in self.subject_keywords.items():
-            score = sum(1 for keyword in keywords if keyword in query_lower)
+        for subject in self.subject_keywords:
+            score = features.count(f"subject:{subject}")
             if score > 0:
                 subject_scores[subject] = score
         
         if subject_scores:
             return max(subject_scores, key=subject_scores.get)
         
+        tracer.current_span().set_attribute("method", "llm")
+        
         # Fallback to Gemini classification
         classification_prompt = f"""
         Classify this educational query into one of these subjects: math, physics, chemistry, biology, computer_science, language_arts, history, geography.
-        
+        {self.conversation_block(context)}
         Query: "{query}"
         
         Respond with only the subject name.
         """
         
         try:
-            response = self.model.generate_content(classification_prompt)
-            return response.text.strip().lower()
+            response_text = await self.inflight.do(
+                f"classify:{self.cache_key('classify', query, context=context)}",
+                lambda: self.generate(classification_prompt, context, cache_key=self.cache_key("classify", query, context=context))
+            )
+            return response_text.strip().lower()
         except:
             return "general"
     
     async def process(self, message: AgentMessage, context: AgentContext) -> str:
         query = message.content
+        features = self.get_features(query, context)
         
         # Classify the query
-        subject = await self.classify_query(query)
+        with tracer.span("tutor.classify_query") as span:
+            subject = await self.classify_query(query, features, context)
+            span.set_attribute("subject", subject)
+        
+        async def routed() -> str:
+            # Past the deadline the stream is cancelled and the best partial answer returned
+            return await collect_response(with_deadline(self._route_stream(message, context, subject, features), context))
+        
+        if context.bypass_cache:
+            return await routed()
+        
+        # Concurrent requests with the same query and routing share one answer
+        return await self.inflight.do(f"query:{subject}:{self.cache_key('route', query, context=context)}", routed)
+    
+    async def process_stream(self, message: AgentMessage, context: AgentContext) -> AsyncIterator[Dict[str, Any]]:
+        query = message.content
+        features = self.get_features(query, context)
+        
+        # Classify the query
+        with tracer.span("tutor.classify_query") as span:
+            subject = await self.classify_query(query, features, context)
+            span.set_attribute("subject", subject)
+        
+        async for event in with_deadline(self._route_stream(message, context, subject, features), context):
+            yield event
+    
+    async def _route_stream(self, message: AgentMessage, context: AgentContext, subject: str,
+                            features: QueryFeatures) -> AsyncIterator[Dict[str, Any]]:
+        query = message.content
         
         # Check if this is a graphing request to prioritize visualization
-        is_graphing_request = any(term in query.lower() for term in [
-            'graph', 'plot', 'visualize', 'draw', 'show the function', 'display'
-        ])
+        is_graphing_request = features.has("tutor:graphing")
         
         # Route to appropriate specialist
         if subject in self.specialist_agents:
             specialist = self.specialist_agents[subject]
+            yield stream_event("route", subject=subject, agent=specialist.name)
             specialist_message = AgentMessage(
                 id=f"msg_{context.session_id}_{context.current_step}",
                 sender_id=self.agent_id,
@@ -78,26 +122,39 @@ class TutorAgent(BaseAgent):
                 timestamp=message.timestamp
             )
             
-            response = await specialist.process(specialist_message, context)
-            
             # For graphing requests, just return the specialist response without additional text
-            if is_graphing_request and subject == "math":
-                return response
-                
-            return f"🎓 **{specialist.name}**:\n\n{response}"
+            header = "" if is_graphing_request and subject == "math" else f"🎓 **{specialist.name}**:\n\n"
+            if header:
+                yield stream_event("token", text=header, header=True)
+            
+            async for event in specialist.process_stream(specialist_message, context):
+                if event["type"] == "final":
+                    yield stream_event("final", response=f"{header}{event['response']}")
+                else:
+                    yield event
         else:
+            yield stream_event("route", subject="general", agent="General Tutor")
             # General response using Gemini
             general_prompt = f"""
             You are an AI tutor. Answer this educational question clearly and concisely:
-            
+            {self.conversation_block(context)}
             Question: {query}
             
             Provide a brief, focused explanation without unnecessary details.
             Get straight to the point and focus on the key concepts.
             """
             
+            header = "🤖 **General Tutor**:\n\n"
+            yield stream_event("token", text=header, header=True)
             try:
-                response = self.model.generate_content(general_prompt)
-                return f"🤖 **General Tutor**:\n\n{response.text}"
+                chunks = []
+                async for chunk in self.generate_stream(
+                    general_prompt, context, cache_key=self.cache_key("general", query, context=context)
+                ):
+                    chunks.append(chunk)
+                    yield stream_event("token", text=chunk)
+                yield stream_event("final", response=header + "".join(chunks))
+            except LLMUnavailableError:
+                yield stream_event("final", response="The AI tutor is temporarily unavailable. Please try again in a moment.")
             except Exception as e:
-                return f"I apologize, but I encountered an error processing your question: {str(e)}"
+                yield stream_event("final", response=f"I apologize, but I encountered an error processing your question: {str(e)}")
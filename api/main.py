@@ -1,10 +1,13 @@
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse, Response
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
-from typing import Optional
+from typing import Any, Dict, List, Optional, Tuple
 import asyncio
+import json
+import time
+import zlib
 import os
 from pathlib import Path
 from datetime import datetime
@@ -14,9 +17,40 @@ from agents.math_agent import MathAgent
 from agents.physics_agent import PhysicsAgent
 from core.base_agent import AgentMessage, AgentContext
 from core.state_manager import state_manager
+from config.settings import settings
+from core.response_cache import response_cache, normalize_query
+from core.llm_client import llm_client
+from core.query_features import feature_extractor
+from core.context_window import context_window
+from core.metrics import metrics, ANSWER_PATH
+from core.tracing import tracer
+from core.loop_watchdog import loop_watchdog
 
 app = FastAPI(title="AI Tutor Multi-Agent System", version="1.0.0")
 
+class TracingMiddleware:
+    """Root span per API request, covering streamed bodies too; the trace ID is returned as X-Trace-Id"""
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith("/api/") or not tracer.enabled:
+            return await self.app(scope, receive, send)
+        
+        # Honour a caller-supplied trace ID so client and server spans line up
+        headers = dict(scope.get("headers") or [])
+        incoming = headers.get(b"x-trace-id", b"").decode("latin-1")[:64] or None
+        with tracer.span(f"{scope['method']} {scope['path']}", trace_id=incoming) as span:
+            async def send_with_trace_id(message):
+                if message["type"] == "http.response.start":
+                    span.set_attribute("status_code", message["status"])
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [(b"x-trace-id", span.trace_id.encode("latin-1"))]
+                await send(message)
+            await self.app(scope, receive, send_with_trace_id)
+
+app.add_middleware(TracingMiddleware)
+
 # Create directories if they don't exist
 def ensure_directories():
     directories = ["static", "templates", "logs"]
@@ -38,66 +72,293 @@ physics_agent = PhysicsAgent()
 tutor_agent.register_specialist("math", math_agent)
 tutor_agent.register_specialist("physics", physics_agent)
 
+# Build the shared keyword matcher once all agents have registered their tables
+feature_extractor.compile()
+
+def collect_runtime_gauges():
+    """State owned by other components, read only when /metrics is scraped"""
+    limiter = llm_client.limiter
+    yield "tutor_llm_in_flight", "Model calls currently running", llm_client.in_flight, {}
+    yield "tutor_llm_concurrency_limit", "Current adaptive concurrency limit", limiter.limit, {}
+    yield "tutor_llm_queued", "Model calls waiting for a concurrency slot", limiter.queued, {}
+    for state in ("closed", "open", "half_open"):
+        yield "tutor_llm_circuit_state", "1 for the circuit breaker's current state", float(llm_client.breaker.state == state), {"state": state}
+    cache_stats = response_cache.get_stats()
+    for result in ("local_hits", "redis_hits", "misses", "bypassed"):
+        yield "tutor_response_cache_lookups", "Response cache lookups by result", cache_stats[result], {"result": result}
+    yield "tutor_response_cache_entries", "Entries in the local response cache", cache_stats["entries"], {}
+    inflight = tutor_agent.inflight.get_stats()
+    yield "tutor_inflight_queries", "Distinct queries currently being computed", inflight["in_flight"], {}
+    yield "tutor_inflight_coalesced", "Queries served by joining an identical in-flight query", inflight["coalesced"], {}
+    answered = {path: ANSWER_PATH.total(path=path) for path in ("tool", "llm")}
+    total_answers = answered["tool"] + answered["llm"]
+    yield "tutor_llm_avoidance_ratio", "Share of specialist answers served from tools without a model call", answered["tool"] / total_answers if total_answers else 0.0, {}
+    yield "tutor_state_backend_redis", "1 when sessions are stored in Redis, 0 for the in-memory fallback", float(state_manager.use_redis), {}
+    state_stats = state_manager.get_stats()
+    l1_cache = state_stats.get("l1_cache")
+    if l1_cache:
+        for result in ("hits", "misses"):
+            yield "tutor_session_cache_lookups", "L1 session cache lookups by result", l1_cache[result], {"result": result}
+        yield "tutor_session_cache_invalidations", "L1 session cache entries dropped after writes elsewhere", l1_cache["invalidations"], {}
+    memory = state_stats.get("memory")
+    if memory:
+        yield "tutor_state_memory_sessions", "Sessions held by the in-memory store", memory["sessions"], {}
+        yield "tutor_state_memory_history_bytes", "Approximate bytes of history held by the in-memory store", memory["approx_history_bytes"], {}
+        for reason in ("evicted", "expired"):
+            yield "tutor_state_memory_removed", "In-memory sessions removed by LRU eviction or expiry", memory[reason], {"reason": reason}
+
+metrics.register_collector(collect_runtime_gauges)
+
 class QueryRequest(BaseModel):
     query: str
     session_id: Optional[str] = None
+    bypass_cache: bool = False
+    timeout_seconds: Optional[float] = None
+
+class BatchQueryRequest(BaseModel):
+    queries: List[str]
+    bypass_cache: bool = False
+    timeout_seconds: Optional[float] = None  # per query, counted from when it starts
+    max_parallel: Optional[int] = None
 
 class QueryResponse(BaseModel):
     response: str
     session_id: str
     agent_used: str
+    tool_timings: List[Dict[str, Any]] = []
+
+@app.on_event("startup")
+async def connect_state_manager():
+    await state_manager.connect()
+
+@app.on_event("startup")
+async def start_loop_watchdog():
+    if settings.loop_watchdog_enabled:
+        loop_watchdog.start()
+
+@app.on_event("shutdown")
+async def stop_loop_watchdog():
+    await loop_watchdog.stop()
+
+@app.on_event("shutdown")
+async def close_state_manager():
+    await state_manager.close()
 
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
+def request_budget(request: QueryRequest) -> float:
+    """Seconds this request may run: the client's timeout if given, capped by the server maximum"""
+    budget = request.timeout_seconds or settings.request_timeout_seconds
+    return max(0.1, min(budget, settings.max_request_timeout_seconds))
+
+async def prepare_turn(request: QueryRequest) -> Tuple[str, AgentContext, AgentMessage, Dict[str, Any]]:
+    """Resolve the session and build the context and message for one query.
+
+    Also returns the session context entries changed while preparing, to be
+    saved with the turn by commit_turn.
+    """
+    # Get session context; a session created here is known to be empty
+    session_data = None
+    if request.session_id:
+        session_data = await state_manager.get_session(request.session_id, history_limit=settings.context_history_messages)
+    if session_data:
+        session_id = request.session_id
+    else:
+        session_id = await state_manager.create_session()
+        session_data = {"context": {}, "conversation_history": [], "history_offset": 0}
+    tracer.current_span().set_attribute("session_id", session_id)
+    
+    # Create context
+    session_context = session_data.get("context", {})
+    history = session_data["conversation_history"]
+    history_offset = session_data.get("history_offset", 0)
+    current_step = history_offset + len(history) + 1
+    summary_state = session_context.get(context_window.STATE_KEY)
+    summarized_upto = summary_state["upto"] if summary_state else 0
+    if summarized_upto < history_offset:
+        # Messages the summary has not folded in yet are older than the recent read; fetch them so they
+        # reach the summary or the prompt instead of silently dropping out of both
+        page = await state_manager.get_history_page(session_id, history_offset - summarized_upto, after=summarized_upto - 1)
+        if page and page["conversation_history"]:
+            earlier = [{key: value for key, value in message.items() if key != "position"}
+                       for message in page["conversation_history"]]
+            history = earlier + history
+            history_offset = page["history_offset"]
+    budget = request_budget(request)
+    context = AgentContext(
+        session_id=session_id,
+        user_query=request.query,
+        conversation_history=history,
+        current_step=current_step,
+        workflow_state=session_context,
+        bypass_cache=request.bypass_cache,
+        deadline=time.monotonic() + budget
+    )
+    
+    # Pack prior turns for the prompts; summary upkeep may use at most half the budget
+    with tracer.span("context_window.build", history_messages=len(history)) as span:
+        context.history_context, summary_changed = await context_window.build(
+            history, session_context,
+            timeout=min(llm_client.timeout, budget / 2), offset=history_offset
+        )
+        span.set_attribute("summary_updated", summary_changed)
+    context_updates = {}
+    if summary_changed:
+        context_updates[context_window.STATE_KEY] = session_context[context_window.STATE_KEY]
+    
+    # Create message
+    message = AgentMessage(
+        id=f"msg_{session_id}_{context.current_step}",
+        sender_id="user",
+        receiver_id=tutor_agent.agent_id,
+        content=request.query,
+        message_type="query",
+        timestamp=datetime.now()
+    )
+    return session_id, context, message, context_updates
+
 @app.post("/api/query", response_model=QueryResponse)
 async def process_query(request: QueryRequest):
     try:
-        # Create or get session
-        session_id = request.session_id or await state_manager.create_session()
-        
-        # Get session context
-        session_data = await state_manager.get_session(session_id)
-        if not session_data:
-            session_id = await state_manager.create_session()
-            session_data = await state_manager.get_session(session_id)
-        
-        # Create context
-        context = AgentContext(
-            session_id=session_id,
-            user_query=request.query,
-            conversation_history=session_data["conversation_history"],
-            current_step=len(session_data["conversation_history"]) + 1,
-            workflow_state=session_data.get("context", {})
-        )
-        
-        # Create message
-        message = AgentMessage(
-            id=f"msg_{session_id}_{context.current_step}",
-            sender_id="user",
-            receiver_id=tutor_agent.agent_id,
-            content=request.query,
-            message_type="query",
-            timestamp=datetime.now()
-        )
+        session_id, context, message, context_updates = await prepare_turn(request)
         
         # Process with tutor agent
         response = await tutor_agent.process(message, context)
         
-        # Update session
-        await state_manager.add_to_history(session_id, "user", request.query)
-        await state_manager.add_to_history(session_id, "assistant", response)
+        # Update session; the context updates were derived from the history as of this turn's start
+        await state_manager.commit_turn(session_id, request.query, response, context_updates,
+                                        expected_seq=context.current_step - 1)
         
         return QueryResponse(
             response=response,
             session_id=session_id,
-            agent_used=tutor_agent.name
+            agent_used=tutor_agent.name,
+            tool_timings=context.tool_timings
         )
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def sse_event(event_type: str, data: Dict[str, Any]) -> str:
+    return f"event: {event_type}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/api/query/stream")
+async def process_query_stream(request: QueryRequest):
+    """Stream the answer as Server-Sent Events: session, route, token, tool, final, done"""
+    try:
+        session_id, context, message, context_updates = await prepare_turn(request)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    async def event_stream():
+        yield sse_event("session", {"session_id": session_id, "agent_used": tutor_agent.name})
+        try:
+            response = None
+            async for event in tutor_agent.process_stream(message, context):
+                if event["type"] == "final":
+                    response = event["response"]
+                yield sse_event(event["type"], event)
+            
+            # Only a completed stream is written to the session history
+            if response is not None:
+                await state_manager.commit_turn(session_id, request.query, response, context_updates,
+                                                expected_seq=context.current_step - 1)
+            yield sse_event("done", {"session_id": session_id, "tool_timings": context.tool_timings})
+        except Exception as e:
+            yield sse_event("error", {"detail": str(e)})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def batch_turn(batch_id: str, index: int, query: str, request: BatchQueryRequest) -> Tuple[AgentContext, AgentMessage]:
+    """Context and message for one worksheet problem; batch items carry no conversation"""
+    budget = request_budget(QueryRequest(query=query, timeout_seconds=request.timeout_seconds))
+    context = AgentContext(
+        session_id=batch_id,
+        user_query=query,
+        conversation_history=[],
+        current_step=1,
+        workflow_state={},
+        bypass_cache=request.bypass_cache,
+        deadline=time.monotonic() + budget
+    )
+    message = AgentMessage(
+        id=f"msg_{batch_id}_{index}",
+        sender_id="user",
+        receiver_id=tutor_agent.agent_id,
+        content=query,
+        message_type="query",
+        timestamp=datetime.now()
+    )
+    return context, message
+
+@app.post("/api/query/batch")
+async def process_query_batch(request: BatchQueryRequest):
+    """Answer many independent queries, streamed back as NDJSON in completion order.
+    
+    Duplicate problems (after normalization) are computed once and reported for
+    every index that asked them; at most max_parallel distinct problems run at a time.
+    """
+    if not request.queries:
+        raise HTTPException(status_code=400, detail="No queries given")
+    if len(request.queries) > settings.batch_max_queries:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch of {len(request.queries)} queries exceeds the limit of {settings.batch_max_queries}"
+        )
+    
+    # Group indices by normalized query so each distinct problem runs once
+    groups: Dict[str, List[int]] = {}
+    for index, query in enumerate(request.queries):
+        groups.setdefault(normalize_query(query), []).append(index)
+    
+    max_parallel = min(request.max_parallel or settings.batch_max_parallel, settings.batch_max_parallel)
+    semaphore = asyncio.Semaphore(max(1, max_parallel))
+    batch_id = f"batch_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
+    
+    async def run_one(indices: List[int]) -> Tuple[List[int], Dict[str, Any]]:
+        query = request.queries[indices[0]]
+        async with semaphore:
+            # The deadline starts once the problem is admitted, not while it queues
+            context, message = batch_turn(batch_id, indices[0], query, request)
+            start = time.perf_counter()
+            try:
+                response = await tutor_agent.process(message, context)
+                result = {"response": response, "agent_used": tutor_agent.name, "tool_timings": context.tool_timings}
+            except Exception as e:
+                result = {"error": str(e)}
+            result["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            return indices, result
+    
+    async def result_stream():
+        started = time.perf_counter()
+        tasks = [asyncio.ensure_future(run_one(indices)) for indices in groups.values()]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                indices, result = await next_done
+                for index in indices:
+                    line = {"type": "result", "index": index, "query": request.queries[index], **result}
+                    if index != indices[0]:
+                        line["duplicate_of"] = indices[0]
+                    yield json.dumps(line) + "\n"
+            yield json.dumps({
+                "type": "done",
+                "total": len(request.queries),
+                "unique": len(groups),
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+            }) + "\n"
+        finally:
+            # Client went away: stop the problems that have not finished
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson")
+
 @app.post("/api/session/new", response_model=dict)
 async def create_new_session():
     try:
@@ -118,13 +379,63 @@ async def create_new_session():
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def session_etag(metadata: Dict[str, Any], total_messages: int) -> str:
+    """Weak validator for a session response.
+
+    Appends bump the message count; replacing or clearing the history bumps
+    "history_generation" in the metadata; everything else is in the metadata
+    hash. Together they fix the body of a given URL.
+    """
+    digest = zlib.crc32(json.dumps(metadata, sort_keys=True, default=str).encode("utf-8"))
+    return f'W/"{metadata.get("history_generation", 0)}-{total_messages}-{digest:08x}"'
+
 @app.get("/api/session/{session_id}")
-async def get_session(session_id: str):
-    session_data = await state_manager.get_session(session_id)
+async def get_session(
+    session_id: str,
+    request: Request,
+    history: bool = True,
+    limit: Optional[int] = Query(None, ge=1, le=settings.session_page_max_messages),
+    before: Optional[int] = Query(None, ge=0),
+    after: Optional[int] = Query(None, ge=-1)
+):
+    """Session metadata and history.
+
+    With no parameters the whole retained history is returned, as before.
+    `limit` returns the latest messages; `before`/`after` page older or newer
+    messages from a position cursor (each message carries its "position"),
+    and `history=false` returns metadata only. Responses carry an ETag, and a
+    matching If-None-Match gets a 304 without reading the history.
+    """
+    if before is not None and after is not None:
+        raise HTTPException(status_code=400, detail="Use either before or after, not both")
+    
+    # Metadata and message count only; usually served from the L1 cache
+    session_data = await state_manager.get_session(session_id, history_limit=0)
     if not session_data:
         raise HTTPException(status_code=404, detail="Session not found")
+    metadata = {key: value for key, value in session_data.items() if key not in ("conversation_history", "history_offset")}
+    total_messages = session_data["history_offset"]
+    etag = session_etag(metadata, total_messages)
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]):
+        return Response(status_code=304, headers={"ETag": etag})
     
-    return session_data
+    if not history:
+        body = {**metadata, "total_messages": total_messages}
+    elif limit is None and before is None and after is None:
+        body = await state_manager.get_session(session_id)
+        if not body:
+            raise HTTPException(status_code=404, detail="Session not found")
+        total_messages = body["history_offset"] + len(body["conversation_history"])
+        body["total_messages"] = total_messages
+    else:
+        page = await state_manager.get_history_page(session_id, limit or settings.session_page_default_messages, before, after)
+        if page is None:
+            raise HTTPException(status_code=404, detail="Session not found")
+        total_messages = page["total_messages"]
+        body = {**metadata, **page}
+    # A write between the two reads shows up as a different message count
+    return JSONResponse(body, headers={"ETag": session_etag(metadata, total_messages), "Cache-Control": "no-cache"})
 
 @app.get("/api/agents")
 async def get_agents():
@@ -150,6 +461,43 @@ async def get_agents():
         }
     }
 
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    return response_cache.get_stats()
+
+@app.get("/api/state/stats")
+async def get_state_stats():
+    """Session storage backend and, for the in-memory store, its size and evictions"""
+    return state_manager.get_stats()
+
+@app.get("/api/llm/health")
+async def get_llm_health():
+    """Circuit breaker and adaptive limiter state for the model backend"""
+    return llm_client.get_health()
+
+@app.get("/api/inflight/stats")
+async def get_inflight_stats():
+    """Counts of executed vs coalesced identical in-flight queries"""
+    return tutor_agent.inflight.get_stats()
+
+@app.get("/api/debug/loop")
+async def get_loop_stalls():
+    """Recent event-loop stalls caught by the watchdog (stacks are in the log file)"""
+    return loop_watchdog.get_stats()
+
+@app.get("/api/traces/{trace_id}")
+async def get_trace(trace_id: str):
+    """Waterfall of a recent trace: spans ordered by start with offsets from the request start"""
+    spans = tracer.get_trace(trace_id)
+    if spans is None:
+        raise HTTPException(status_code=404, detail="Trace not found (only recent traces are kept in memory)")
+    return {"trace_id": trace_id, "spans": spans}
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus text exposition of agent, tool, model and state-manager metrics"""
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,107 @@
+"""Per-request keyword scanning cost: repeated substring scans vs one compiled pass.
+
+Run from the project root:
+    python -m benchmarks.bench_query_features --iterations 20000
+"""
+import argparse
+import time
+
+from agents.tutor_agent import TutorAgent
+from agents.math_agent import MathAgent
+from agents.physics_agent import PhysicsAgent
+from core.query_features import feature_extractor
+
+QUERIES = [
+    "Solve the equation 2x + 5 = 11",
+    "Graph f(x) = x^2 - 3x + 2 on the plane",
+    "Calculate the force with mass 5 kg and acceleration 10 m/s^2",
+    "What is the speed of light constant?",
+    "Convert 5 meters to feet",
+    "Explain the causes of the French revolution in the 18th century",
+    "Find the derivative of sin(x) * x^3 and plot it",
+    "What is the kinetic energy of a 2 kg ball with velocity 3 m/s?",
+]
+
+
+def legacy_scan(query: str, subject_keywords: dict) -> dict:
+    """The scans one request used to trigger across the tutor and both specialists"""
+    query_lower = query.lower()
+    scores = {}
+    for subject, keywords in subject_keywords.items():
+        score = sum(1 for keyword in keywords if keyword in query_lower)
+        if score > 0:
+            scores[subject] = score
+    graph_terms = ['graph', 'plot', 'visualize', 'draw', 'show the function',
+                   'display function', 'show f(x)', 'plot f(x)']
+    return {
+        "scores": scores,
+        "tutor_graphing": any(term in query.lower() for term in [
+            'graph', 'plot', 'visualize', 'draw', 'show the function', 'display']),
+        "equation": any(p in query.lower() for p in ['solve', 'equation', 'find x', 'find the value']),
+        "graphing": any(p in query.lower() for p in graph_terms),
+        "primarily_graphing": any(p in query.lower() for p in graph_terms),
+        "calculation": any(op in query for op in ['+', '-', '*', '/', '=', 'calculate']),
+        "solving": any(w in query.lower() for w in ['solve', 'equation', 'find x']),
+        "plot_3d": any(t in query.lower() for t in ['3d', 'surface', 'three dimensional']),
+        "constants": any(w in query.lower() for w in ['constant', 'speed of light', 'planck', 'gravity']),
+        "conversion": any(w in query.lower() for w in ['convert', 'unit', 'meter', 'kilogram']),
+        "physics_calc": any(w in query.lower() for w in ['calculate', 'find', 'formula']),
+        "math_score": sum(1 for i in ["solve", "calculate", "equation", "derivative", "integral",
+                                      "graph", "plot", "algebra", "geometry", "trigonometry"] if i in query.lower()),
+        "physics_score": sum(1 for i in ["force", "velocity", "acceleration", "energy", "momentum",
+                                         "newton", "einstein", "quantum", "electromagnetic", "gravity"] if i in query.lower()),
+    }
+
+
+def compiled_scan(query: str, subjects) -> dict:
+    """The same decisions read from one feature record"""
+    features = feature_extractor.extract(query)
+    return {
+        "scores": {s: features.count(f"subject:{s}") for s in subjects if features.has(f"subject:{s}")},
+        "tutor_graphing": features.has("tutor:graphing"),
+        "equation": features.has("math:equation_solving"),
+        "graphing": features.has("math:graphing"),
+        "calculation": features.has("math:calculation"),
+        "solving": features.has("math:solving"),
+        "plot_3d": features.has("math:plot_3d"),
+        "constants": features.has("physics:constants"),
+        "conversion": features.has("physics:conversion"),
+        "physics_calc": features.has("physics:calculation"),
+        "math_score": features.count("math:indicators"),
+        "physics_score": features.count("physics:indicators"),
+    }
+
+
+def bench(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for i in range(iterations):
+        fn(QUERIES[i % len(QUERIES)])
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    tutor = TutorAgent()
+    MathAgent()
+    PhysicsAgent()
+    feature_extractor.compile()
+
+    start = time.perf_counter()
+    feature_extractor.compile()
+    compile_us = (time.perf_counter() - start) * 1e6
+
+    subjects = list(tutor.subject_keywords)
+    before = bench(lambda q: legacy_scan(q, tutor.subject_keywords), args.iterations)
+    after = bench(lambda q: compiled_scan(q, subjects), args.iterations)
+
+    print(f"automaton compile (once at startup): {compile_us:.1f} us")
+    print(f"before (repeated substring scans):   {before:.2f} us/request")
+    print(f"after  (single compiled pass):       {after:.2f} us/request")
+    print(f"speedup: {before / after:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
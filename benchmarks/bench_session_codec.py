@@ -0,0 +1,128 @@
+"""Bytes and CPU of the session codec versus the legacy JSON storage.
+
+Builds a tutoring conversation where some answers embed Plotly figures (the
+same <plotly-graph> payloads GraphingTool produces) and compares:
+
+    legacy blob     the whole session as one json.dumps blob, rewritten every turn
+    legacy entries  one JSON document per message with an ISO timestamp
+    codec ...       session_codec per message: JSON or msgpack, with/without zlib
+
+Run from the project root:
+    python -m benchmarks.bench_session_codec
+    python -m benchmarks.bench_session_codec --turns 40 --graph-every 3 --json
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+import plotly.graph_objects as go
+
+from core.session_codec import SessionCodec, msgpack
+
+
+def graph_message(points: int) -> str:
+    x = np.linspace(-10, 10, points)
+    fig = go.Figure(data=[go.Scatter(x=x, y=np.sin(x) * x, mode="lines")])
+    fig.update_layout(title="f(x) = x*sin(x)", xaxis_title="x", yaxis_title="y")
+    return f"Here's the graph of f(x) = x*sin(x):\n\n<plotly-graph>{fig.to_json()}</plotly-graph>"
+
+
+def build_history(turns: int, graph_every: int, points: int) -> List[Dict[str, Any]]:
+    start = datetime.now() - timedelta(hours=1)
+    graph = graph_message(points)
+    history = []
+    for turn in range(turns):
+        asked = start + timedelta(seconds=30 * turn)
+        answer = graph if graph_every and turn % graph_every == graph_every - 1 else (
+            "🎓 **Mathematics Expert**:\n\nTo solve 2x + 5 = 11, subtract 5 from both sides to get 2x = 6, "
+            "then divide by 2: **x = 3**. You can check it: 2(3) + 5 = 11."
+        )
+        history.append({"role": "user", "message": f"Question {turn}: solve 2x + 5 = 11", "timestamp": asked.isoformat()})
+        history.append({"role": "assistant", "message": answer, "timestamp": (asked + timedelta(seconds=2)).isoformat()})
+    return history
+
+
+def timed(fn: Callable[[], Any], repeat: int) -> float:
+    """Best-of-three average seconds per call"""
+    best = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        best = min(best, (time.perf_counter() - start) / repeat)
+    return best
+
+
+def measure(history: List[Dict[str, Any]], repeat: int) -> Dict[str, Dict[str, float]]:
+    session = {"created_at": history[0]["timestamp"], "conversation_history": history, "context": {}, "active": True}
+    results = {}
+
+    blob = json.dumps(session)
+    results["legacy blob"] = {
+        "stored_bytes": len(blob),
+        "bytes_written_per_turn": len(blob),
+        "encode_us": timed(lambda: json.dumps(session), repeat) * 1e6,
+        "decode_us": timed(lambda: json.loads(blob), repeat) * 1e6,
+    }
+
+    entries = [json.dumps(message) for message in history]
+    results["legacy entries"] = {
+        "stored_bytes": sum(len(entry) for entry in entries),
+        "bytes_written_per_turn": sum(len(entry) for entry in entries[-2:]),
+        "encode_us": timed(lambda: [json.dumps(message) for message in history], repeat) * 1e6,
+        "decode_us": timed(lambda: [json.loads(entry) for entry in entries], repeat) * 1e6,
+    }
+
+    variants = {
+        "codec json": SessionCodec(compress_threshold=0, use_msgpack=False),
+        "codec json+zlib": SessionCodec(compress_threshold=1024, use_msgpack=False),
+    }
+    if msgpack is not None:
+        variants["codec msgpack"] = SessionCodec(compress_threshold=0, use_msgpack=True)
+        variants["codec msgpack+zlib"] = SessionCodec(compress_threshold=1024, use_msgpack=True)
+    for name, codec in variants.items():
+        encoded = [codec.encode_message(message) for message in history]
+        assert [codec.decode_message(entry)["message"] for entry in encoded] == [m["message"] for m in history]
+        results[name] = {
+            "stored_bytes": sum(len(entry) for entry in encoded),
+            "bytes_written_per_turn": sum(len(entry) for entry in encoded[-2:]),
+            "encode_us": timed(lambda: [codec.encode_message(message) for message in history], repeat) * 1e6,
+            "decode_us": timed(lambda: [codec.decode_message(entry) for entry in encoded], repeat) * 1e6,
+        }
+
+    base = results["legacy blob"]["stored_bytes"]
+    for result in results.values():
+        result["size_vs_legacy"] = round(result["stored_bytes"] / base, 3)
+        result["encode_us"] = round(result["encode_us"], 1)
+        result["decode_us"] = round(result["decode_us"], 1)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=30)
+    parser.add_argument("--graph-every", type=int, default=4, help="every Nth answer embeds a figure (0 = none)")
+    parser.add_argument("--points", type=int, default=400, help="samples per figure")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    history = build_history(args.turns, args.graph_every, args.points)
+    results = measure(history, args.repeat)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{args.turns} turns, {len(history)} messages, figure every {args.graph_every or '-'} answers"
+          f"{'' if msgpack is not None else ' (msgpack not installed)'}")
+    print(f"{'format':<20}{'stored B':>11}{'vs legacy':>11}{'B/turn':>10}{'encode us':>12}{'decode us':>12}")
+    for name, result in results.items():
+        print(f"{name:<20}{result['stored_bytes']:>11}{result['size_vs_legacy']:>11.3f}"
+              f"{result['bytes_written_per_turn']:>10}{result['encode_us']:>12.1f}{result['decode_us']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
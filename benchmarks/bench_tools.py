@@ -0,0 +1,222 @@
+"""Microbenchmarks for every tool in tools/, with a JSON baseline and regression check.
+
+Each case runs a tool's execute() over a representative query corpus, the same
+way agents call it (including the executor hop for sympy and plotting work).
+
+Run from the project root:
+    python -m benchmarks.bench_tools                          # print results
+    python -m benchmarks.bench_tools --save benchmarks/baselines/tools.json
+    python -m benchmarks.bench_tools --compare benchmarks/baselines/tools.json --threshold 0.25
+
+Each case is measured --repeats times and the fastest median is kept, which
+filters out runs slowed by unrelated load. --compare exits with status 1 when
+a case's median is slower than the baseline by more than the threshold and
+by more than --min-delta-us, so it can gate CI without failing on
+microsecond-scale noise in the fast cases; the executor-bound cases also
+have a looser per-case threshold (CASE_THRESHOLDS).
+"""
+import argparse
+import asyncio
+import json
+import platform
+import re
+import statistics
+import sys
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Tuple
+
+from tools.calculator_tool import CalculatorTool
+from tools.graphing_tool import GraphingTool
+from tools.equation_solver_tool import EquationSolverTool
+from tools.unit_converter_tool import UnitConverterTool
+from tools.physics_calculator_tool import PhysicsCalculatorTool
+from tools.physics_constants_tool import PhysicsConstantsTool
+
+# (case name, tool factory, corpus of execute() kwargs)
+CASES: List[Tuple[str, Callable[[], Any], List[Dict[str, Any]]]] = [
+    ("calculator", CalculatorTool, [
+        {"expression": "calculate 2+3*4"},
+        {"expression": "calculate (17 - 5) / 4"},
+        {"expression": "12 times 7 plus 3"},
+        {"expression": "calculate 2**10 - 24"},
+        {"expression": "calculate 3.5 * (2 + 8) / 7"},
+    ]),
+    ("graphing_2d", GraphingTool, [
+        {"function": "plot y = x^2 - 3*x + 2", "plot_type": "2d"},
+        {"function": "graph sin(x)", "plot_type": "2d"},
+        {"function": "plot f(x) = x**3 - x", "plot_type": "2d"},
+    ]),
+    ("graphing_3d", GraphingTool, [
+        {"function": "x**2 + y**2", "plot_type": "3d"},
+        {"function": "sin(x) * cos(y)", "plot_type": "3d"},
+    ]),
+    ("equation_solver_linear", EquationSolverTool, [
+        {"equation": "solve 2x + 5 = 11"},
+        {"equation": "solve 3x - 4 = 20"},
+        {"equation": "solve 5x + 7 = 32"},
+    ]),
+    ("equation_solver_sympy", EquationSolverTool, [
+        {"equation": "solve x**2 - 5*x + 6 = 0"},
+        {"equation": "solve x**3 - x = 0"},
+        {"equation": "solve 2*x**2 + 3*x - 2 = 0"},
+    ]),
+    ("unit_converter", UnitConverterTool, [
+        {"query": "convert 5 meter to foot"},
+        {"query": "convert 100 celsius to fahrenheit"},
+        {"query": "3.5 kilogram to pound"},
+        {"query": "convert 2 kwh to joule"},
+    ]),
+    ("physics_calculator", PhysicsCalculatorTool, [
+        {"problem": "calculate force with mass 5 and acceleration 10"},
+        {"problem": "potential energy with mass 2 and height 5"},
+        {"problem": "voltage with current 2 and resistance 5"},
+        {"problem": "wave frequency 50 wavelength 2"},
+    ]),
+    ("physics_constants", PhysicsConstantsTool, [
+        {"query": "planck"},
+        {"query": "speed of light"},
+        {"query": "boltzmann"},
+        {"query": "electron"},
+    ]),
+]
+# Cases that hop to the executor and allocate heavily (plotly, sympy) swing more between
+# runs; a slowdown must pass this threshold, if larger than --threshold, to count
+CASE_THRESHOLDS: Dict[str, float] = {
+    "graphing_2d": 0.5,
+    "graphing_3d": 0.5,
+    "equation_solver_sympy": 0.5,
+}
+
+# Tools report failures as text; timing those would measure the error path, not the work
+ERROR_PATTERN = re.compile(r"^(No |Could not|I couldn't|Please |Found values|Unknown unit)| error: ")
+
+
+class CorpusError(Exception):
+    pass
+
+
+async def check_corpus(tool, corpus: List[Dict[str, Any]]):
+    """Fail the run if any corpus input produces an error result"""
+    for kwargs in corpus:
+        result = str(await tool.execute(**kwargs))
+        if ERROR_PATTERN.search(result):
+            raise CorpusError(f"{tool.name} failed on {kwargs}: {result[:120]}")
+
+
+async def measure(tool, corpus: List[Dict[str, Any]], iterations: int) -> List[float]:
+    samples: List[float] = []
+    for _ in range(iterations):
+        for kwargs in corpus:
+            start = time.perf_counter()
+            await tool.execute(**kwargs)
+            samples.append(time.perf_counter() - start)
+    return sorted(samples)
+
+
+async def bench_case(tool, corpus: List[Dict[str, Any]], iterations: int, warmup: int, repeats: int) -> Dict[str, float]:
+    await check_corpus(tool, corpus)
+    for _ in range(warmup):
+        for kwargs in corpus:
+            await tool.execute(**kwargs)
+
+    # The run with the fastest median is the least disturbed by other work on the machine
+    runs = [await measure(tool, corpus, iterations) for _ in range(repeats)]
+    samples = min(runs, key=statistics.median)
+    return {
+        "calls": len(samples),
+        "repeats": repeats,
+        "median_us": round(statistics.median(samples) * 1e6, 2),
+        "mean_us": round(statistics.fmean(samples) * 1e6, 2),
+        "p95_us": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1e6, 2),
+        "ops_per_s": round(len(samples) / sum(samples), 1),
+    }
+
+
+async def run(iterations: int, warmup: int, only: List[str], repeats: int = 5) -> Dict[str, Any]:
+    results = {}
+    for name, factory, corpus in CASES:
+        if only and name not in only:
+            continue
+        # Slow cases get fewer rounds so the suite stays quick
+        rounds = max(1, iterations // 10) if name.startswith(("graphing", "equation_solver_sympy")) else iterations
+        results[name] = await bench_case(factory(), corpus, rounds, warmup, repeats)
+    return {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "iterations": iterations,
+        "results": results,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float, min_delta_us: float = 0.0) -> List[str]:
+    """Print a per-case comparison of medians and return the names of regressed cases.
+
+    A case regresses when it is slower by more than its threshold (the larger
+    of `threshold` and its CASE_THRESHOLDS entry) and by more than
+    min_delta_us in absolute terms.
+    """
+    regressions = []
+    print(f"{'case':<26}{'baseline us':>14}{'current us':>14}{'change':>10}")
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            print(f"{name:<26}{'-':>14}{result['median_us']:>14.1f}{'new':>10}")
+            continue
+        change = result["median_us"] / base["median_us"] - 1.0 if base["median_us"] else 0.0
+        allowed = max(threshold, CASE_THRESHOLDS.get(name, 0.0))
+        regressed = change > allowed and result["median_us"] - base["median_us"] > min_delta_us
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{name:<26}{base['median_us']:>14.1f}{result['median_us']:>14.1f}{change:>+10.1%}{flag}")
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def print_results(report: Dict[str, Any]):
+    print(f"{'case':<26}{'median us':>12}{'p95 us':>12}{'ops/s':>12}")
+    for name, result in report["results"].items():
+        print(f"{name:<26}{result['median_us']:>12.1f}{result['p95_us']:>12.1f}{result['ops_per_s']:>12.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200, help="rounds over each corpus (slow cases use a tenth)")
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--repeats", type=int, default=5, help="measurements per case; the fastest median is kept")
+    parser.add_argument("--only", nargs="+", default=[], choices=[name for name, _, _ in CASES])
+    parser.add_argument("--save", metavar="PATH", help="write the results as a JSON baseline")
+    parser.add_argument("--compare", metavar="PATH", help="compare against a saved JSON baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed median slowdown, e.g. 0.25 = 25%%")
+    parser.add_argument("--min-delta-us", type=float, default=10.0,
+                        help="slowdowns smaller than this many microseconds never count as regressions")
+    args = parser.parse_args()
+
+    try:
+        report = asyncio.run(run(args.iterations, args.warmup, args.only, args.repeats))
+    except CorpusError as e:
+        # Nothing is saved or compared from a corpus that no longer exercises the tools
+        print(f"Corpus check failed: {e}")
+        sys.exit(1)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"Baseline written to {args.save}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold, args.min_delta_us)
+        if regressions:
+            print(f"\n{len(regressions)} case(s) regressed beyond {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.threshold:.0%}")
+    elif not args.save:
+        print_results(report)
+
+
+if __name__ == "__main__":
+    main()
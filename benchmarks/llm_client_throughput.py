@@ -0,0 +1,37 @@
+"""Offline throughput check for the shared LLM client using the fake model.
+
+Run from the project root:
+    python -m benchmarks.llm_client_throughput --calls 500 --concurrency 16 --latency-ms 100
+"""
+import argparse
+import asyncio
+import time
+
+from core.llm_client import LLMClient, FakeModelBackend
+
+
+async def run(calls: int, concurrency: int, latency_ms: float, jitter_ms: float):
+    backend = FakeModelBackend(latency_ms=latency_ms, jitter_ms=jitter_ms)
+    client = LLMClient(backend=backend, max_concurrency=concurrency, timeout=60)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client.generate(f"prompt {i}") for i in range(calls)))
+    elapsed = time.perf_counter() - start
+
+    ideal = calls / concurrency * latency_ms / 1000.0
+    print(f"calls={calls} concurrency={concurrency} latency={latency_ms}ms")
+    print(f"elapsed={elapsed:.3f}s ideal={ideal:.3f}s throughput={calls / elapsed:.1f} calls/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency-ms", type=float, default=100.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    args = parser.parse_args()
+    asyncio.run(run(args.calls, args.concurrency, args.latency_ms, args.jitter_ms))
+
+
+if __name__ == "__main__":
+    main()
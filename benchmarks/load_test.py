@@ -0,0 +1,209 @@
+"""End-to-end load test of /api/query against an in-process fake model.
+
+Boots the FastAPI app in-process (no network, no Gemini quota) and drives it
+at a target concurrency, reporting throughput, latency percentiles and
+event-loop lag so regressions in our own code show up independently of the
+provider.
+
+Run from the project root:
+    python -m benchmarks.load_test --requests 2000 --concurrency 64 --latency-ms 200
+    python -m benchmarks.load_test --latency-distribution lognormal --sigma 0.6 --json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import time
+from typing import Dict, List, Optional
+
+QUERIES = {
+    "math": [
+        "Solve the equation 2x + 5 = 11",
+        "calculate 12 * (3 + 4)",
+        "Find the derivative of sin(x) * x^3 and explain the steps",
+        "Graph f(x) = x^2 - 3x + 2",
+    ],
+    "physics": [
+        "Calculate the force with mass 5 kg and acceleration 10 in newton physics",
+        "Explain the energy of a 2 kg ball in physics with velocity 3",
+        "What is momentum in physics and why is it conserved?",
+    ],
+    "general": [
+        "Explain the causes of the French revolution",
+        "What is photosynthesis?",
+        "Describe the water cycle in geography",
+    ],
+}
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an unsorted list"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+class LoopLagMonitor:
+    """Samples how late a periodic sleep wakes up; lateness is time the loop spent blocked"""
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - start - self.interval))
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+def configure_environment(args):
+    # Settings are read at import time, so the fake backend is selected before the app loads
+    os.environ["LLM_BACKEND"] = "fake"
+    os.environ["FAKE_LLM_LATENCY_MS"] = str(args.latency_ms)
+    os.environ["FAKE_LLM_LATENCY_JITTER_MS"] = str(args.jitter_ms)
+    os.environ["FAKE_LLM_LATENCY_DISTRIBUTION"] = args.latency_distribution
+    os.environ["FAKE_LLM_LATENCY_SIGMA"] = str(args.sigma)
+    if args.response_text:
+        os.environ["FAKE_LLM_RESPONSE"] = args.response_text
+    if args.llm_concurrency:
+        os.environ["LLM_MAX_CONCURRENCY"] = str(args.llm_concurrency)
+    if args.disable_tracing:
+        os.environ["TRACING_ENABLED"] = "false"
+
+
+def build_workload(mix: List[str], total: int) -> List[str]:
+    pool = [query for subject in mix for query in QUERIES[subject]]
+    return [query for query, _ in zip(itertools.cycle(pool), range(total))]
+
+
+async def run(args) -> Dict[str, object]:
+    configure_environment(args)
+    import httpx
+    from api.main import app
+    from core.llm_client import llm_client
+
+    workload = build_workload(args.mix, args.requests)
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    session_ids: List[Optional[str]] = [None] * args.sessions
+
+    await app.router.startup()
+    transport = httpx.ASGITransport(app=app)
+    monitor = LoopLagMonitor()
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=None) as client:
+        queue: asyncio.Queue = asyncio.Queue()
+        for index, query in enumerate(workload):
+            queue.put_nowait((index, query))
+
+        async def worker():
+            while True:
+                try:
+                    index, query = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                payload = {"query": query, "bypass_cache": not args.use_cache}
+                slot = index % args.sessions if args.sessions else None
+                if slot is not None and session_ids[slot]:
+                    payload["session_id"] = session_ids[slot]
+                start = time.perf_counter()
+                try:
+                    response = await client.post("/api/query", json=payload)
+                    if response.status_code != 200:
+                        errors[str(response.status_code)] = errors.get(str(response.status_code), 0) + 1
+                        continue
+                    if slot is not None:
+                        session_ids[slot] = response.json()["session_id"]
+                except Exception as e:
+                    errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+                    continue
+                latencies.append(time.perf_counter() - start)
+
+        monitor.start()
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+        await monitor.stop()
+    await app.router.shutdown()
+
+    lag = monitor.samples
+    return {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "fake_model": {
+            "latency_ms": args.latency_ms,
+            "distribution": args.latency_distribution,
+            "jitter_ms": args.jitter_ms,
+            "sigma": args.sigma,
+        },
+        "completed": len(latencies),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 1),
+            "p95": round(percentile(latencies, 95) * 1000, 1),
+            "p99": round(percentile(latencies, 99) * 1000, 1),
+            "max": round(max(latencies, default=0.0) * 1000, 1),
+        },
+        "loop_lag_ms": {
+            "p50": round(percentile(lag, 50) * 1000, 2),
+            "p99": round(percentile(lag, 99) * 1000, 2),
+            "max": round(max(lag, default=0.0) * 1000, 2),
+        },
+        "model_calls": llm_client.total_calls,
+    }
+
+
+def print_report(report: Dict[str, object]):
+    model = report["fake_model"]
+    latency = report["latency_ms"]
+    lag = report["loop_lag_ms"]
+    print(f"requests={report['requests']} concurrency={report['concurrency']} "
+          f"fake model={model['latency_ms']}ms {model['distribution']}")
+    print(f"completed={report['completed']} errors={report['errors'] or 0} model_calls={report['model_calls']}")
+    print(f"elapsed={report['elapsed_s']}s throughput={report['throughput_rps']} req/s")
+    print(f"latency p50={latency['p50']}ms p95={latency['p95']}ms p99={latency['p99']}ms max={latency['max']}ms")
+    print(f"loop lag p50={lag['p50']}ms p99={lag['p99']}ms max={lag['max']}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="fixed latency, or the median for lognormal")
+    parser.add_argument("--latency-distribution", choices=["fixed", "uniform", "lognormal"], default="fixed")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="+/- spread for the uniform distribution")
+    parser.add_argument("--sigma", type=float, default=0.5, help="shape of the lognormal distribution")
+    parser.add_argument("--response-text", default=None, help="canned model answer")
+    parser.add_argument("--llm-concurrency", type=int, default=None, help="override LLM_MAX_CONCURRENCY")
+    parser.add_argument("--mix", nargs="+", choices=sorted(QUERIES), default=sorted(QUERIES))
+    parser.add_argument("--sessions", type=int, default=0, help="reuse this many sessions (0 = new session per request)")
+    parser.add_argument("--use-cache", action="store_true", help="allow response cache hits (bypassed by default)")
+    parser.add_argument("--disable-tracing", action="store_true")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
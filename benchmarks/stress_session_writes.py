@@ -0,0 +1,164 @@
+"""Hundreds of concurrent writers on one session, checked for lost or torn turns.
+
+Each writer does what /api/query does: read the recent history, "think" for a
+random time (standing in for the model call), then commit_turn a unique
+question/answer pair with a context update and the seq it read. Metadata
+writers run update_session against the same session meanwhile, and a set of
+unrelated sessions is written at the same time to show the hot session does
+not hold them up.
+
+Afterwards the full history must contain every pair exactly once, each answer
+directly after its question, with seq equal to the number of messages.
+Context updates computed from a stale read are expected to be skipped; they
+are reported as conflicts, not failures.
+
+Uses REDIS_URL / REDIS_URLS like the app, or the in-memory store when Redis
+is unreachable. Run from the project root:
+    python -m benchmarks.stress_session_writes
+    python -m benchmarks.stress_session_writes --writers 500 --turns 2 --think-ms 20 --json
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from typing import Any, Dict, List
+
+from benchmarks.load_test import percentile
+from config.settings import settings
+
+
+async def write_turns(state_manager, session_id: str, name: str, turns: int, think_ms: float,
+                      latencies: List[float]):
+    for turn in range(turns):
+        session = await state_manager.get_session(session_id, history_limit=settings.context_history_messages)
+        expected_seq = session["history_offset"] + len(session["conversation_history"])
+        await asyncio.sleep(random.uniform(0, think_ms) / 1000)
+        start = time.perf_counter()
+        committed = await state_manager.commit_turn(
+            session_id, f"q {name} {turn}", f"a {name} {turn}", {"last_writer": name}, expected_seq=expected_seq
+        )
+        latencies.append(time.perf_counter() - start)
+        if not committed:
+            raise RuntimeError(f"Session {session_id} disappeared under {name}")
+
+
+async def update_metadata(state_manager, session_id: str, name: str, updates: int, think_ms: float):
+    from core.state_manager import SessionConflictError
+
+    for update in range(updates):
+        await asyncio.sleep(random.uniform(0, think_ms) / 1000)
+        try:
+            await state_manager.update_session(session_id, {"last_update": f"{name} {update}"})
+        except SessionConflictError:
+            # Gave up after its bounded retries; counted in the report
+            pass
+
+
+def verify(history: List[Dict[str, Any]], history_offset: int, expected: List[str]) -> List[str]:
+    """Problems found in the final history; empty when every turn landed whole and once"""
+    problems = []
+    if history_offset != 0:
+        problems.append(f"history was trimmed (offset {history_offset}); raise SESSION_HISTORY_MAX_MESSAGES")
+    questions = [entry["message"] for entry in history if entry["role"] == "user"]
+    missing = set(expected) - set(questions)
+    if missing:
+        problems.append(f"{len(missing)} turns lost, e.g. {sorted(missing)[:3]}")
+    duplicated = len(questions) - len(set(questions))
+    if duplicated:
+        problems.append(f"{duplicated} turns written twice")
+    torn = [index for index in range(0, len(history), 2)
+            if index + 1 >= len(history) or history[index]["role"] != "user"
+            or history[index + 1]["message"] != "a" + history[index]["message"][1:]]
+    if torn:
+        problems.append(f"{len(torn)} question/answer pairs interleaved, first at position {torn[0]}")
+    return problems
+
+
+async def run(writers: int, turns: int, updaters: int, other_sessions: int, think_ms: float) -> Dict[str, Any]:
+    # Keep every message so the check can see all of them
+    settings.session_history_max_messages = max(settings.session_history_max_messages, 2 * (writers + other_sessions) * turns)
+    from core.metrics import STATE_CONFLICTS
+    from core.state_manager import state_manager
+
+    await state_manager.connect()
+    try:
+        session_id = await state_manager.create_session()
+        others = [await state_manager.create_session() for _ in range(other_sessions)]
+        hot_latencies: List[float] = []
+        other_latencies: List[float] = []
+        tasks = [write_turns(state_manager, session_id, f"w{index}", turns, think_ms, hot_latencies)
+                 for index in range(writers)]
+        tasks += [update_metadata(state_manager, session_id, f"u{index}", turns, think_ms) for index in range(updaters)]
+        tasks += [write_turns(state_manager, other, "solo", turns, think_ms, other_latencies) for other in others]
+        random.shuffle(tasks)
+
+        start = time.perf_counter()
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+
+        final = await state_manager.get_session(session_id)
+        history = final["conversation_history"]
+        problems = verify(history, final["history_offset"],
+                          [f"q w{index} {turn}" for index in range(writers) for turn in range(turns)])
+        for other in others:
+            session = await state_manager.get_session(other)
+            problems += [f"unrelated session: {problem}" for problem in verify(
+                session["conversation_history"], session["history_offset"], [f"q solo {turn}" for turn in range(turns)]
+            )]
+        return {
+            "backend": state_manager.get_stats()["backend"],
+            "writers": writers,
+            "turns_per_writer": turns,
+            "metadata_writers": updaters,
+            "unrelated_sessions": other_sessions,
+            "messages": len(history),
+            "seq": final["history_offset"] + len(history),
+            "elapsed_s": round(elapsed, 3),
+            "commits_per_s": round(len(hot_latencies) / elapsed, 1) if elapsed else 0.0,
+            "hot_commit_ms": {"p50": round(percentile(hot_latencies, 50) * 1000, 3),
+                              "p99": round(percentile(hot_latencies, 99) * 1000, 3)},
+            "unrelated_commit_ms": {"p50": round(percentile(other_latencies, 50) * 1000, 3),
+                                    "p99": round(percentile(other_latencies, 99) * 1000, 3)},
+            "stale_context_skipped": int(STATE_CONFLICTS.value(operation="commit_turn")),
+            "metadata_write_retries": int(STATE_CONFLICTS.value(operation="update_session")),
+            "metadata_writes_given_up": int(STATE_CONFLICTS.value(operation="update_session_gave_up")),
+            "last_writer": final["context"].get("last_writer"),
+            "problems": problems,
+        }
+    finally:
+        await state_manager.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--writers", type=int, default=300, help="concurrent writers on the hot session")
+    parser.add_argument("--turns", type=int, default=1, help="turns per writer")
+    parser.add_argument("--updaters", type=int, default=20, help="concurrent update_session writers on the hot session")
+    parser.add_argument("--other-sessions", type=int, default=50, help="unrelated sessions written at the same time")
+    parser.add_argument("--think-ms", type=float, default=10.0, help="max random delay between read and commit")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args.writers, args.turns, args.updaters, args.other_sessions, args.think_ms))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{report['backend']}: {report['writers']} writers x {report['turns_per_writer']} turns on one session, "
+              f"{report['metadata_writers']} metadata writers, {report['unrelated_sessions']} unrelated sessions")
+        print(f"  {report['messages']} messages (seq {report['seq']}) in {report['elapsed_s']}s, "
+              f"{report['commits_per_s']} commits/s")
+        print(f"  commit latency ms  hot p50 {report['hot_commit_ms']['p50']} p99 {report['hot_commit_ms']['p99']}"
+              f"  unrelated p50 {report['unrelated_commit_ms']['p50']} p99 {report['unrelated_commit_ms']['p99']}")
+        print(f"  stale context updates skipped {report['stale_context_skipped']}, "
+              f"metadata write retries {report['metadata_write_retries']} "
+              f"(gave up {report['metadata_writes_given_up']})")
+        print("  OK: no lost, duplicated or torn turns" if not report["problems"] else
+              "  FAILED:\n" + "\n".join(f"    {problem}" for problem in report["problems"]))
+    if report["problems"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,10 +3,85 @@ from typing import Optional
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
-    gemini_api_key: str
+    gemini_api_key: str = ""
     redis_url: str = "redis://localhost:6379"
+    redis_urls: str = ""  # comma-separated nodes to shard sessions over; defaults to redis_url
+    redis_ring_replicas: int = 160  # virtual points per node on the consistent-hash ring
+    redis_max_connections: int = 50
+    redis_pool_timeout_seconds: float = 5.0  # wait for a free pooled connection
+    redis_connect_timeout_seconds: float = 2.0
+    redis_socket_timeout_seconds: float = 2.0
+
+    # Session history (an append-only list per session)
+    session_history_max_messages: int = 500  # oldest messages are dropped beyond this; 0 keeps all
+    session_codec_msgpack: bool = True  # used when the optional msgpack package is installed
+    session_compress_threshold_bytes: int = 1024  # zlib-compress encoded values at least this large; 0 disables
+    session_page_default_messages: int = 50  # GET /api/session page size when a cursor is given without a limit
+    session_page_max_messages: int = 200
+
+    # Per-worker L1 session cache in front of Redis, kept coherent over pub/sub
+    session_cache_enabled: bool = True
+    session_cache_max_entries: int = 2048
+    session_cache_ttl_seconds: float = 30.0  # bounds staleness if an invalidation is lost
+
+    # In-memory session store (used when Redis is unavailable)
+    memory_max_sessions: int = 10000  # least recently used sessions are evicted beyond this
+    memory_sweep_interval_seconds: float = 60.0
     environment: str = "development"
-    
+
+    # LLM client
+    llm_backend: str = "gemini"  # "gemini" or "fake"
+    llm_max_concurrency: int = 16
+    llm_timeout_seconds: float = 30.0
+    llm_min_concurrency: int = 2
+    llm_latency_target_seconds: float = 8.0
+    llm_circuit_failure_rate: float = 0.5
+    llm_circuit_min_calls: int = 10
+    llm_circuit_window: int = 20
+    llm_circuit_reset_seconds: float = 30.0
+
+    # Fake model (offline throughput measurement)
+    fake_llm_latency_ms: float = 200.0
+    fake_llm_latency_jitter_ms: float = 0.0
+    fake_llm_latency_distribution: str = "uniform"  # "fixed", "uniform" (+/- jitter) or "lognormal"
+    fake_llm_latency_sigma: float = 0.5  # lognormal shape; latency_ms is the median
+    fake_llm_response: str = "This is a canned response from the fake model."
+
+    # LLM response cache
+    response_cache_enabled: bool = True
+    response_cache_max_entries: int = 1024
+    response_cache_ttl_seconds: float = 3600.0
+    response_cache_redis_ttl_seconds: int = 86400
+
+    # Conversation context packed into prompts
+    context_token_budget: int = 1500
+    context_summary_token_budget: int = 300
+    context_summary_batch_messages: int = 6  # messages past the window before the summary is updated
+    context_history_messages: int = 50  # recent messages read per turn; older ones live in the summary
+
+    # Tools
+    tool_timeout_seconds: float = 5.0
+
+    # Batch endpoint
+    batch_max_queries: int = 200
+    batch_max_parallel: int = 8
+
+    # Tracing (the last traces are kept in memory; set a path to also export spans as JSON lines)
+    tracing_enabled: bool = True
+    trace_export_path: str = ""  # e.g. logs/traces.jsonl
+    trace_export_max_bytes: int = 50 * 1024 * 1024  # rotated to <path>.1 beyond this; 0 disables rotation
+    trace_buffer_size: int = 200
+
+    # Event-loop watchdog (opt-in; for development and staging)
+    loop_watchdog_enabled: bool = False
+    loop_watchdog_threshold_ms: float = 100.0
+    loop_watchdog_interval_ms: float = 20.0
+    loop_watchdog_log_path: str = "logs/loop_blocking.jsonl"
+
+    # End-to-end request budget (clients may ask for less, or more up to the max)
+    request_timeout_seconds: float = 30.0
+    max_request_timeout_seconds: float = 120.0
+
     class Config:
         env_file = ".env"
 
@@ -1,10 +1,19 @@
 from abc import ABC, abstractmethod
-from typing import Dict, List, Any, Optional
-from dataclasses import dataclass
+from typing import Dict, List, Any, Optional, AsyncIterator
+from dataclasses import dataclass, field
 from enum import Enum
 import uuid
 import asyncio
+import functools
+import logging
+import time
 from datetime import datetime
+from core.llm_client import llm_client, DEFAULT_MODEL
+from core.metrics import AGENT_LATENCY, ANSWER_PATH, TOOL_LATENCY
+from core.tracing import tracer
+from core.response_cache import response_cache, ResponseCache
+from core.query_features import QueryFeatures, feature_extractor
+from core.base_tool import AnswerSufficiency
 
 class AgentType(Enum):
     ORCHESTRATOR = "orchestrator"
@@ -33,28 +42,334 @@ class AgentContext:
     conversation_history: List[Dict[str, str]]
     current_step: int
     workflow_state: Dict[str, Any]
+    bypass_cache: bool = False
+    features: Optional[QueryFeatures] = None
+    tool_timings: List[Dict[str, Any]] = field(default_factory=list)
+    # Absolute time.monotonic() deadline for the whole request, if any
+    deadline: Optional[float] = None
+    # Work completed so far, used to build a partial answer if the deadline hits
+    partial_results: List[str] = field(default_factory=list)
+    partial_text: str = ""
+    # Agent label streamed ahead of the answer; not content on its own
+    partial_header: str = ""
+    # Rolling summary plus recent turns, packed to a token budget for prompts
+    history_context: str = ""
+    
+    def remaining(self) -> Optional[float]:
+        """Seconds left before the deadline, or None when the request is unbounded"""
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+    
+    def bound_timeout(self, timeout: Optional[float]) -> Optional[float]:
+        """Clamp a per-call timeout so it never outlives the request deadline"""
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        remaining = max(remaining, 0.0)
+        return remaining if timeout is None else min(timeout, remaining)
+
+class DeadlineExceeded(Exception):
+    """Raised when work is started after the request deadline has passed"""
+
+@dataclass
+class ToolOutcome:
+    name: str
+    result: Any = None
+    error: Optional[str] = None
+    latency: float = 0.0
+    # Ran fine but reported it could not handle the input (e.g. "Could not extract ..."),
+    # as opposed to raising or timing out
+    declined: bool = False
+    
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+logger = logging.getLogger("agents")
+
+def stream_event(event_type: str, **data) -> Dict[str, Any]:
+    """Build a response stream event: "token", "tool" or the closing "final" """
+    return {"type": event_type, **data}
+
+async def collect_response(events: AsyncIterator[Dict[str, Any]]) -> str:
+    """Drain a response stream and return the final response text"""
+    tokens = []
+    final = None
+    async for event in events:
+        if event["type"] == "token":
+            tokens.append(event["text"])
+        elif event["type"] == "final":
+            final = event["response"]
+    return final if final is not None else "".join(tokens)
+
+def best_partial_response(context: AgentContext) -> str:
+    """Best answer available when the deadline expires: streamed text plus finished tool results"""
+    parts = []
+    if context.partial_text.strip():
+        parts.append(context.partial_header + context.partial_text.strip())
+    parts.extend(str(result) for result in context.partial_results if str(result) not in context.partial_text)
+    if not parts:
+        return "Sorry, I ran out of time before I could answer this. Please try again or ask a simpler question."
+    return "⏱️ I ran out of time before finishing, but here is what I have so far:\n\n" + "\n\n".join(parts)
+
+async def with_deadline(events: AsyncIterator[Dict[str, Any]], context: AgentContext) -> AsyncIterator[Dict[str, Any]]:
+    """Relay a response stream until the context deadline, then cancel it and emit the best partial answer"""
+    events = events.__aiter__()
+    try:
+        while True:
+            timeout = context.bound_timeout(None)
+            if timeout is not None and timeout <= 0:
+                raise asyncio.TimeoutError()
+            try:
+                event = await asyncio.wait_for(events.__anext__(), timeout)
+            except StopAsyncIteration:
+                return
+            if event["type"] == "token":
+                if event.get("header"):
+                    context.partial_header += event["text"]
+                else:
+                    context.partial_text += event["text"]
+            yield event
+    except asyncio.TimeoutError:
+        logger.warning(f"Request deadline exceeded for session {context.session_id}; returning partial answer")
+        yield stream_event("final", response=best_partial_response(context), partial=True)
+    finally:
+        await events.aclose()
+
+def _status_for(error: BaseException) -> str:
+    return "cancelled" if isinstance(error, (asyncio.CancelledError, GeneratorExit)) else "error"
+
+def _timed_process(process):
+    @functools.wraps(process)
+    async def wrapper(self, message, context):
+        start = time.perf_counter()
+        status = "ok"
+        try:
+            with tracer.span(f"{self.agent_id}.process", agent=self.name):
+                return await process(self, message, context)
+        except BaseException as e:
+            status = _status_for(e)
+            raise
+        finally:
+            AGENT_LATENCY.observe(time.perf_counter() - start, agent=self.agent_id, method="process", status=status)
+    return wrapper
+
+def _timed_process_stream(process_stream):
+    @functools.wraps(process_stream)
+    async def wrapper(self, message, context):
+        start = time.perf_counter()
+        status = "ok"
+        events = process_stream(self, message, context)
+        # The span is only made current while the inner stream runs, never across a yield,
+        # because each step of a generator may run in a different task's context
+        span = tracer.start_span(f"{self.agent_id}.process_stream", agent=self.name)
+        try:
+            while True:
+                with tracer.activate(span):
+                    try:
+                        event = await events.__anext__()
+                    except StopAsyncIteration:
+                        break
+                yield event
+        except BaseException as e:
+            status = _status_for(e)
+            raise
+        finally:
+            # Close the inner stream now so its cleanup runs before the timing is recorded
+            with tracer.activate(span):
+                await events.aclose()
+            span.end(status)
+            AGENT_LATENCY.observe(time.perf_counter() - start, agent=self.agent_id, method="process_stream", status=status)
+    return wrapper
 
 class BaseAgent(ABC):
+    def __init_subclass__(cls, **kwargs):
+        # Every concrete agent's entry points are timed without each agent opting in
+        super().__init_subclass__(**kwargs)
+        if "process" in cls.__dict__:
+            cls.process = _timed_process(cls.__dict__["process"])
+        if "process_stream" in cls.__dict__:
+            cls.process_stream = _timed_process_stream(cls.__dict__["process_stream"])
+    
     def __init__(self, agent_id: str, agent_type: AgentType, name: str):
         self.agent_id = agent_id
         self.agent_type = agent_type
         self.name = name
         self.tools: List['BaseTool'] = []
         self.capabilities: List[str] = []
+        self.model_name: str = DEFAULT_MODEL
+        # Bump when a prompt template changes so cached responses are not reused
+        self.prompt_version: str = "2"
         
     @abstractmethod
     async def process(self, message: AgentMessage, context: AgentContext) -> str:
         pass
     
+    async def process_stream(self, message: AgentMessage, context: AgentContext) -> AsyncIterator[Dict[str, Any]]:
+        """Yield response events; agents without token streaming emit their full answer at once"""
+        response = await self.process(message, context)
+        yield stream_event("final", response=response)
+    
     def add_tool(self, tool: 'BaseTool'):
         self.tools.append(tool)
     
-    async def use_tool(self, tool_name: str, **kwargs) -> Any:
+    def get_tool(self, tool_name: str) -> Optional['BaseTool']:
+        return next((tool for tool in self.tools if tool.name == tool_name), None)
+    
+    def tool_answer(self, query: str, results: List[tuple]) -> Optional[str]:
+        """Templated answer when the (tool_name, result) pairs fully answer the query, else None.
+        
+        Every tool must report a complete answer or that it did not apply, and at
+        least one must be complete; any partial result sends the query to the model.
+        """
+        parts = []
+        for tool_name, result in results:
+            tool = self.get_tool(tool_name)
+            verdict = tool.answer_sufficiency(query, result) if tool else AnswerSufficiency.PARTIAL
+            if verdict is AnswerSufficiency.PARTIAL:
+                return None
+            if verdict is AnswerSufficiency.COMPLETE:
+                parts.append(tool.format_answer(result))
+        return "\n\n".join(parts) if parts else None
+    
+    def record_answer_path(self, path: str):
+        """Count "tool" (model skipped) vs "llm" answers for the LLM-avoidance rate"""
+        ANSWER_PATH.inc(agent=self.agent_id, path=path)
+        tracer.current_span().set_attribute("answer_path", path)
+    
+    async def use_tool(self, tool_name: str, context: Optional[AgentContext] = None, **kwargs) -> Any:
         for tool in self.tools:
             if tool.name == tool_name:
-                return await tool.execute(**kwargs)
+                timeout = None
+                if context is not None and context.deadline is not None:
+                    timeout = context.bound_timeout(None)
+                    if timeout <= 0:
+                        raise DeadlineExceeded(f"Request deadline passed before {tool_name} could run")
+                with TOOL_LATENCY.time(tool=tool_name) as labels, tracer.span(f"tool.{tool_name}") as span:
+                    try:
+                        result = await asyncio.wait_for(tool.execute(**kwargs), timeout)
+                    except (asyncio.TimeoutError, asyncio.CancelledError):
+                        labels["status"] = "timeout"
+                        raise
+                    labels["status"] = "ok"
+                    span.set_attribute("result_chars", len(str(result)))
+                    return result
         raise ValueError(f"Tool {tool_name} not found")
     
-    def can_handle(self, query: str) -> float:
+    async def run_tool(self, tool_name: str, kwargs: Dict[str, Any], context: Optional[AgentContext] = None) -> ToolOutcome:
+        """Run one tool under its own deadline and record its latency on the context"""
+        tool = self.get_tool(tool_name)
+        timeout = tool.timeout if tool else None
+        if context is not None:
+            timeout = context.bound_timeout(timeout)
+        start = time.perf_counter()
+        try:
+            if timeout is not None and timeout <= 0:
+                raise DeadlineExceeded("request deadline exceeded")
+            result = await asyncio.wait_for(self.use_tool(tool_name, **kwargs), timeout)
+            query = context.user_query if context is not None else ""
+            if tool is not None and tool.answer_sufficiency(query, result) is AnswerSufficiency.NONE:
+                # Tools report most failures as text; keep those out of prompts and partial answers
+                outcome = ToolOutcome(tool_name, error=str(result)[:200], declined=True)
+            else:
+                outcome = ToolOutcome(tool_name, result=result)
+        except asyncio.TimeoutError:
+            outcome = ToolOutcome(tool_name, error=f"timed out after {timeout:.1f}s")
+        except Exception as e:
+            outcome = ToolOutcome(tool_name, error=str(e))
+        outcome.latency = time.perf_counter() - start
+        
+        latency_ms = round(outcome.latency * 1000, 1)
+        if context is not None:
+            if outcome.ok:
+                context.partial_results.append(str(outcome.result))
+            context.tool_timings.append({
+                "agent": self.agent_id,
+                "tool": tool_name,
+                "latency_ms": latency_ms,
+                "status": "ok" if outcome.ok else "failed"
+            })
+        if outcome.ok:
+            logger.info(f"Tool {tool_name} finished in {latency_ms}ms")
+        else:
+            logger.warning(f"Tool {tool_name} dropped after {latency_ms}ms: {outcome.error}")
+        return outcome
+    
+    async def fan_out_tools(self, calls: List[tuple], context: Optional[AgentContext] = None) -> AsyncIterator[ToolOutcome]:
+        """Run independent (tool_name, kwargs) calls concurrently, yielding outcomes as they finish.
+        
+        Each call is bounded by its tool's own deadline; slow or failing tools come back
+        as outcomes with an error instead of holding up the others.
+        """
+        tasks = [asyncio.ensure_future(self.run_tool(name, kwargs, context)) for name, kwargs in calls]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    def get_features(self, query: str, context: Optional[AgentContext] = None) -> QueryFeatures:
+        """Reuse the feature record carried on the context, extracting it once if missing"""
+        if context is not None and context.features is not None and context.features.query == query:
+            return context.features
+        features = feature_extractor.extract(query)
+        if context is not None:
+            context.features = features
+        return features
+    
+    def _llm_timeout(self, context: Optional[AgentContext]) -> Optional[float]:
+        if context is None or context.deadline is None:
+            return None
+        timeout = context.bound_timeout(llm_client.timeout)
+        if timeout <= 0:
+            raise DeadlineExceeded("Request deadline passed before the model call")
+        return timeout
+    
+    def cache_key(self, template: str, query: str, tool_results: List[str] = None,
+                  context: Optional[AgentContext] = None) -> str:
+        # Follow-ups depend on the conversation, so it is part of the key when present
+        history = context.history_context if context is not None else ""
+        return ResponseCache.make_key(self.agent_id, template, self.prompt_version, query, tool_results, history)
+    
+    def conversation_block(self, context: Optional[AgentContext]) -> str:
+        """Prompt section with the packed conversation, empty on the first turn"""
+        if context is None or not context.history_context:
+            return ""
+        return f"Conversation so far (use it to resolve follow-up questions):\n{context.history_context}\n"
+    
+    async def generate(self, prompt: str, context: Optional[AgentContext] = None, cache_key: str = None) -> str:
+        """Run a prompt through the shared non-blocking LLM client, using the response cache when keyed"""
+        if cache_key and context is not None and context.bypass_cache:
+            response_cache.record_bypass()
+        elif cache_key:
+            cached = await response_cache.get(cache_key)
+            if cached is not None:
+                return cached
+        
+        response = await llm_client.generate(prompt, model_name=self.model_name, timeout=self._llm_timeout(context))
+        if cache_key:
+            await response_cache.set(cache_key, response.text)
+        return response.text
+    
+    async def generate_stream(self, prompt: str, context: Optional[AgentContext] = None, cache_key: str = None) -> AsyncIterator[str]:
+        """Streaming counterpart of generate; a cache hit is yielded as a single chunk"""
+        if cache_key and context is not None and context.bypass_cache:
+            response_cache.record_bypass()
+        elif cache_key:
+            cached = await response_cache.get(cache_key)
+            if cached is not None:
+                yield cached
+                return
+        
+        chunks = []
+        async for chunk in llm_client.stream(prompt, model_name=self.model_name, timeout=self._llm_timeout(context)):
+            chunks.append(chunk)
+            yield chunk
+        if cache_key:
+            await response_cache.set(cache_key, "".join(chunks))
+    
+    def can_handle(self, query: str, features: Optional[QueryFeatures] = None) -> float:
         """Return confidence score (0-1) for handling this query"""
         return 0.0
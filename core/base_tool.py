@@ -1,10 +1,28 @@
 from abc import ABC, abstractmethod
-from typing import Any, Dict
+from enum import Enum
+from typing import Any, Callable, Dict
+import asyncio
+import contextvars
+import functools
+import re
+from config.settings import settings
+
+# Queries asking for reasoning rather than a value still need the model, however good the tool result
+EXPLANATION_PATTERN = re.compile(
+    r'\b(why|how|explain|describe|derive|derivation|prove|proof|meaning|mean|intuition|understand|concept|compare)\b'
+)
+
+class AnswerSufficiency(Enum):
+    COMPLETE = "complete"  # the result alone answers the query
+    PARTIAL = "partial"  # useful, but the model should explain or combine it
+    NONE = "none"  # the tool did not apply to this query
 
 class BaseTool(ABC):
-    def __init__(self, name: str, description: str):
+    def __init__(self, name: str, description: str, timeout: float = None):
         self.name = name
         self.description = description
+        # Deadline applied when agents fan out to this tool
+        self.timeout = timeout or settings.tool_timeout_seconds
     
     @abstractmethod
     async def execute(self, **kwargs) -> Any:
@@ -14,3 +32,21 @@ class BaseTool(ABC):
     def get_schema(self) -> Dict[str, Any]:
         """Return tool schema for agent understanding"""
         pass
+    
+    def answer_sufficiency(self, query: str, result: Any) -> AnswerSufficiency:
+        """Whether the result fully answers the query; tools opt in by overriding this"""
+        return AnswerSufficiency.PARTIAL
+    
+    def format_answer(self, result: Any) -> str:
+        """Template used when a complete result is returned without the model"""
+        return str(result)
+    
+    def wants_explanation(self, query: str) -> bool:
+        return bool(EXPLANATION_PATTERN.search(query.lower()))
+    
+    async def run_blocking(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run CPU-heavy or blocking work in the default executor so the event loop stays free"""
+        loop = asyncio.get_running_loop()
+        # Carry the caller's context so trace spans opened in the worker nest under the tool
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(None, functools.partial(context.run, fn, *args, **kwargs))
@@ -0,0 +1,121 @@
+import logging
+import re
+from typing import Any, Dict, List, Tuple
+from config.settings import settings
+from core.llm_client import llm_client
+
+logger = logging.getLogger("context_window")
+
+GRAPH_PATTERN = re.compile(r'<plotly-graph>.*?</plotly-graph>', re.DOTALL)
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token)"""
+    return max(1, len(text) // 4)
+
+
+def _render_message(message: Dict[str, Any]) -> str:
+    # Inline graph payloads are huge and useless to the model; keep a marker instead
+    text = GRAPH_PATTERN.sub("[graph]", message.get("message", ""))
+    role = "Student" if message.get("role") == "user" else "Tutor"
+    return f"{role}: {text.strip()}"
+
+
+class ContextWindowManager:
+    """Packs recent turns verbatim within a token budget and folds older turns into a rolling summary.
+
+    The summary lives in the session's context state as {"text", "upto"}, where
+    "upto" is how many history messages it already covers, so each turn only
+    summarizes the messages that newly fell out of the window. To avoid a model
+    call on nearly every turn, those are summarized once at least
+    summary_batch_messages have built up; until then they stay in the prompt
+    verbatim, a little over the budget. History may be just the recent part of
+    the conversation; offset is the position of its first message, and the
+    caller must include everything from "upto" on.
+    """
+    STATE_KEY = "conversation_summary"
+
+    def __init__(self, token_budget: int = 1500, summary_token_budget: int = 300, summary_batch_messages: int = 6):
+        self.token_budget = token_budget
+        self.summary_token_budget = summary_token_budget
+        self.summary_batch_messages = summary_batch_messages
+
+    def _split(self, history: List[Dict[str, Any]], summarized_upto: int) -> Tuple[int, List[str]]:
+        """Return the index where the verbatim window starts and the rendered recent messages"""
+        budget = self.token_budget - self.summary_token_budget
+        recent: List[str] = []
+        used = 0
+        start = len(history)
+        while start > summarized_upto:
+            rendered = _render_message(history[start - 1])
+            cost = estimate_tokens(rendered)
+            if recent and used + cost > budget:
+                break
+            recent.insert(0, rendered)
+            used += cost
+            start -= 1
+        return start, recent
+
+    async def build(self, history: List[Dict[str, Any]], session_context: Dict[str, Any],
+                    timeout: float = None, offset: int = 0) -> Tuple[str, bool]:
+        """Return (prompt context, whether the stored summary in session_context changed)"""
+        if not history:
+            return "", False
+
+        state = session_context.get(self.STATE_KEY) or {"text": "", "upto": 0}
+        summary, summarized_upto = state["text"], max(0, min(state["upto"] - offset, len(history)))
+
+        start, recent = self._split(history, summarized_upto)
+        changed = False
+        if 0 < start - summarized_upto < self.summary_batch_messages:
+            # Not worth a model call yet; keep them verbatim until a batch has built up
+            recent = [_render_message(message) for message in history[summarized_upto:start]] + recent
+        elif start > summarized_upto:
+            summary = await self._summarize(summary, history[summarized_upto:start], timeout)
+            summarized_upto = start
+            session_context[self.STATE_KEY] = {"text": summary, "upto": offset + summarized_upto}
+            changed = True
+
+        parts = []
+        if summary:
+            parts.append(f"Summary of earlier conversation: {summary}")
+        if recent:
+            parts.append("Recent messages:\n" + "\n".join(recent))
+        return "\n".join(parts), changed
+
+    async def _summarize(self, summary: str, messages: List[Dict[str, Any]], timeout: float = None) -> str:
+        transcript = "\n".join(_render_message(message) for message in messages)
+        prompt = f"""
+        Update the running summary of a tutoring conversation with the new messages below.
+        Keep the facts a tutor needs for follow-up questions (topics, given values, results).
+        Reply with the updated summary only, in at most {self.summary_token_budget * 3} characters.
+
+        Current summary: {summary or "(none)"}
+
+        New messages:
+        {transcript}
+        """
+        try:
+            if timeout is not None and timeout <= 0:
+                raise TimeoutError("no time left in the request budget")
+            response = await llm_client.generate(prompt, timeout=timeout)
+            new_summary = response.text.strip()
+        except Exception as e:
+            # Extractive fallback keeps the conversation usable when the model is unavailable
+            logger.warning(f"Summary update failed, using extractive fallback: {str(e)}")
+            new_summary = " ".join(filter(None, [summary, transcript.replace("\n", " ")]))
+        return self._truncate(new_summary)
+
+    def _truncate(self, text: str) -> str:
+        max_chars = self.summary_token_budget * 4
+        if len(text) <= max_chars:
+            return text
+        # Older content is at the front; keep the most recent part
+        return "..." + text[-(max_chars - 3):]
+
+
+context_window = ContextWindowManager(
+    token_budget=settings.context_token_budget,
+    summary_token_budget=settings.context_summary_token_budget,
+    summary_batch_messages=settings.context_summary_batch_messages
+)
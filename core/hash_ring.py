@@ -0,0 +1,47 @@
+import bisect
+import hashlib
+from typing import Dict, Iterable, List, Tuple
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent-hash ring mapping keys to nodes.
+
+    Each node is placed at `replicas` virtual points so keys spread evenly;
+    adding or removing a node only moves the keys between it and its ring
+    neighbours (about 1/N of them) instead of reshuffling everything.
+    """
+    def __init__(self, nodes: Iterable[str] = (), replicas: int = 160):
+        self.replicas = replicas
+        self._points: List[int] = []
+        self._owners: Dict[int, str] = {}
+        for node in nodes:
+            self.add_node(node)
+
+    @property
+    def nodes(self) -> List[str]:
+        return sorted(set(self._owners.values()))
+
+    def _virtual_points(self, node: str) -> List[Tuple[int, str]]:
+        return [(_hash(f"{node}#{replica}"), node) for replica in range(self.replicas)]
+
+    def add_node(self, node: str):
+        for point, owner in self._virtual_points(node):
+            if point not in self._owners:
+                bisect.insort(self._points, point)
+            self._owners[point] = owner
+
+    def remove_node(self, node: str):
+        for point, _ in self._virtual_points(node):
+            if self._owners.get(point) == node:
+                del self._owners[point]
+                self._points.pop(bisect.bisect_left(self._points, point))
+
+    def node_for(self, key: str) -> str:
+        if not self._points:
+            raise LookupError("Hash ring has no nodes")
+        index = bisect.bisect(self._points, _hash(key)) % len(self._points)
+        return self._owners[self._points[index]]
@@ -0,0 +1,304 @@
+import asyncio
+import logging
+import math
+import random
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, Optional
+from config.settings import settings
+from core.resilience import AdaptiveLimiter, CircuitBreaker
+from core.metrics import LLM_LATENCY, LLM_REJECTED, LLM_TOKENS
+from core.tracing import tracer
+
+logger = logging.getLogger("llm_client")
+
+DEFAULT_MODEL = "gemini-2.0-flash"
+
+
+class LLMError(Exception):
+    """Base error for failed model calls"""
+
+
+class LLMTimeoutError(LLMError):
+    """Raised when a model call exceeds its timeout"""
+
+
+class LLMUnavailableError(LLMError):
+    """Raised without calling the backend while the circuit breaker is open"""
+
+
+@dataclass
+class LLMResponse:
+    text: str
+    model_name: str
+    latency: float
+    prompt_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+
+
+class GeminiBackend:
+    """Gemini backend using the async client, one model object per model name"""
+    def __init__(self, api_key: str):
+        import google.generativeai as genai
+        self._genai = genai
+        if not api_key:
+            logger.warning("GEMINI_API_KEY is not set; Gemini calls will fail")
+        genai.configure(api_key=api_key)
+        self._models: Dict[str, object] = {}
+
+    def _get_model(self, model_name: str):
+        # Models share the library's default async client, so the channel is reused
+        model = self._models.get(model_name)
+        if model is None:
+            model = self._genai.GenerativeModel(model_name)
+            self._models[model_name] = model
+        return model
+
+    async def generate(self, model_name: str, prompt: str) -> LLMResponse:
+        start = time.perf_counter()
+        response = await self._get_model(model_name).generate_content_async(prompt)
+        usage = getattr(response, "usage_metadata", None)
+        return LLMResponse(
+            text=response.text,
+            model_name=model_name,
+            latency=time.perf_counter() - start,
+            prompt_tokens=getattr(usage, "prompt_token_count", None),
+            output_tokens=getattr(usage, "candidates_token_count", None)
+        )
+
+    async def stream(self, model_name: str, prompt: str) -> AsyncIterator[str]:
+        response = await self._get_model(model_name).generate_content_async(prompt, stream=True)
+        async for chunk in response:
+            yield chunk.text
+
+
+class FakeModelBackend:
+    """In-process stand-in for the model with configurable latency and canned text.
+
+    Latency is fixed, uniform within +/- jitter_ms, or lognormal with latency_ms
+    as the median, which gives the long tail real model calls show.
+    """
+    DISTRIBUTIONS = ("fixed", "uniform", "lognormal")
+
+    def __init__(self, response_text: str = None, latency_ms: float = 200.0, jitter_ms: float = 0.0,
+                 distribution: str = "uniform", sigma: float = 0.5):
+        if distribution not in self.DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution: {distribution}")
+        self.response_text = response_text or settings.fake_llm_response
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.distribution = distribution
+        self.sigma = sigma
+        self.calls = 0
+
+    def _sample_latency(self) -> float:
+        if self.distribution == "fixed":
+            latency = self.latency_ms
+        elif self.distribution == "lognormal":
+            latency = random.lognormvariate(math.log(max(self.latency_ms, 1e-3)), self.sigma)
+        else:
+            latency = self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        return max(latency, 0.0) / 1000.0
+
+    async def generate(self, model_name: str, prompt: str) -> LLMResponse:
+        self.calls += 1
+        latency = self._sample_latency()
+        await asyncio.sleep(latency)
+        return LLMResponse(
+            text=self.response_text,
+            model_name=model_name,
+            latency=latency,
+            prompt_tokens=len(prompt.split()),
+            output_tokens=len(self.response_text.split())
+        )
+
+    async def stream(self, model_name: str, prompt: str) -> AsyncIterator[str]:
+        self.calls += 1
+        words = self.response_text.split(" ")
+        # Spread the sampled latency across the chunks, first-token heavy like a real model
+        latency = self._sample_latency()
+        await asyncio.sleep(latency / 2)
+        for index, word in enumerate(words):
+            await asyncio.sleep(latency / 2 / len(words))
+            yield word if index == 0 else f" {word}"
+
+
+def create_backend(backend_name: str = None):
+    backend_name = (backend_name or settings.llm_backend).lower()
+    if backend_name == "fake":
+        return FakeModelBackend(
+            latency_ms=settings.fake_llm_latency_ms,
+            jitter_ms=settings.fake_llm_latency_jitter_ms,
+            distribution=settings.fake_llm_latency_distribution,
+            sigma=settings.fake_llm_latency_sigma
+        )
+    if backend_name == "gemini":
+        return GeminiBackend(settings.gemini_api_key)
+    raise ValueError(f"Unknown LLM backend: {backend_name}")
+
+
+class LLMClient:
+    """Shared async entry point for every model call made by the agents.
+
+    Calls pass through a circuit breaker (fail fast while the backend is
+    unhealthy) and an adaptive AIMD limiter capped at LLM_MAX_CONCURRENCY.
+    """
+    def __init__(self, backend=None, max_concurrency: int = None, timeout: float = None):
+        self._backend = backend
+        self.max_concurrency = max_concurrency or settings.llm_max_concurrency
+        self.timeout = timeout or settings.llm_timeout_seconds
+        self.limiter = AdaptiveLimiter(
+            max_limit=self.max_concurrency,
+            min_limit=settings.llm_min_concurrency,
+            latency_target=settings.llm_latency_target_seconds
+        )
+        self.breaker = CircuitBreaker(
+            failure_rate_threshold=settings.llm_circuit_failure_rate,
+            min_calls=settings.llm_circuit_min_calls,
+            window=settings.llm_circuit_window,
+            reset_timeout=settings.llm_circuit_reset_seconds
+        )
+        self.in_flight = 0
+        self.total_calls = 0
+        self.total_errors = 0
+        self.total_timeouts = 0
+        self.total_rejected = 0
+
+    @property
+    def backend(self):
+        # Built lazily so importing agents does not touch the provider SDK
+        if self._backend is None:
+            self._backend = create_backend()
+        return self._backend
+
+    def set_backend(self, backend):
+        self._backend = backend
+
+    def set_max_concurrency(self, max_concurrency: int):
+        self.max_concurrency = max_concurrency
+        self.limiter.set_max_limit(max_concurrency)
+
+    async def _admit(self, span):
+        if not self.breaker.allow():
+            self.total_rejected += 1
+            LLM_REJECTED.inc()
+            span.end("rejected")
+            raise LLMUnavailableError(f"Model backend unavailable (circuit {self.breaker.state})")
+        queued_at = time.perf_counter()
+        try:
+            await self.limiter.acquire()
+        except BaseException:
+            self.breaker.record_cancelled()
+            span.end("cancelled")
+            raise
+        span.set_attribute("queue_ms", round((time.perf_counter() - queued_at) * 1000, 3))
+        self.in_flight += 1
+        self.total_calls += 1
+
+    def _settle(self, start: float, outcome: str, model_name: str, mode: str, span):
+        """Feed one finished call into the limiter and breaker: success, failure or aborted"""
+        self.in_flight -= 1
+        latency = time.perf_counter() - start
+        LLM_LATENCY.observe(latency, model=model_name, mode=mode, outcome=outcome)
+        span.end("ok" if outcome == "success" else outcome)
+        if outcome == "success":
+            self.limiter.release(latency, success=True)
+            self.breaker.record_success()
+        elif outcome == "failure":
+            self.limiter.release(latency, success=False)
+            self.breaker.record_failure()
+        else:
+            self.limiter.release(measured=False)
+            self.breaker.record_cancelled()
+
+    def _timeout_outcome(self, timeout: float) -> str:
+        # A timeout shortened by the caller's request deadline says nothing about backend health
+        return "failure" if timeout >= self.timeout else "aborted"
+
+    async def generate(self, prompt: str, model_name: str = DEFAULT_MODEL, timeout: float = None) -> LLMResponse:
+        timeout = timeout or self.timeout
+        span = tracer.start_span("llm.generate", model=model_name, prompt_chars=len(prompt))
+        await self._admit(span)
+        start = time.perf_counter()
+        outcome = "aborted"
+        try:
+            response = await asyncio.wait_for(self.backend.generate(model_name, prompt), timeout)
+            outcome = "success"
+            if response.prompt_tokens is not None:
+                LLM_TOKENS.inc(response.prompt_tokens, model=model_name, direction="in")
+                span.set_attribute("prompt_tokens", response.prompt_tokens)
+            if response.output_tokens is not None:
+                LLM_TOKENS.inc(response.output_tokens, model=model_name, direction="out")
+                span.set_attribute("output_tokens", response.output_tokens)
+            return response
+        except asyncio.TimeoutError:
+            self.total_timeouts += 1
+            outcome = self._timeout_outcome(timeout)
+            raise LLMTimeoutError(f"Model call to {model_name} timed out after {timeout:.1f}s")
+        except Exception:
+            self.total_errors += 1
+            outcome = "failure"
+            raise
+        finally:
+            self._settle(start, outcome, model_name, "generate", span)
+
+    async def stream(self, prompt: str, model_name: str = DEFAULT_MODEL, timeout: float = None) -> AsyncIterator[str]:
+        """Yield text chunks as the model produces them; the timeout bounds the whole stream"""
+        timeout = timeout or self.timeout
+        span = tracer.start_span("llm.stream", model=model_name, prompt_chars=len(prompt))
+        await self._admit(span)
+        start = time.perf_counter()
+        outcome = "aborted"
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        chunks = self.backend.stream(model_name, prompt)
+        first_chunk = True
+        try:
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), remaining)
+                except StopAsyncIteration:
+                    break
+                if chunk:
+                    if first_chunk:
+                        first_chunk = False
+                        span.set_attribute("first_chunk_ms", round((time.perf_counter() - start) * 1000, 3))
+                    yield chunk
+            outcome = "success"
+        except asyncio.TimeoutError:
+            self.total_timeouts += 1
+            outcome = self._timeout_outcome(timeout)
+            raise LLMTimeoutError(f"Model stream from {model_name} timed out after {timeout:.1f}s")
+        except Exception:
+            self.total_errors += 1
+            outcome = "failure"
+            raise
+        finally:
+            self._settle(start, outcome, model_name, "stream", span)
+            await chunks.aclose()
+
+    def get_stats(self) -> Dict[str, object]:
+        return {
+            "backend": type(self._backend).__name__ if self._backend else settings.llm_backend,
+            "max_concurrency": self.max_concurrency,
+            "timeout_seconds": self.timeout,
+            "in_flight": self.in_flight,
+            "total_calls": self.total_calls,
+            "total_errors": self.total_errors,
+            "total_timeouts": self.total_timeouts,
+            "total_rejected": self.total_rejected
+        }
+
+    def get_health(self) -> Dict[str, object]:
+        return {
+            "healthy": self.breaker.state == CircuitBreaker.CLOSED,
+            "circuit_breaker": self.breaker.get_state(),
+            "limiter": self.limiter.get_state(),
+            "client": self.get_stats()
+        }
+
+
+llm_client = LLMClient()
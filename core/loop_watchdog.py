@@ -0,0 +1,150 @@
+import asyncio
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from pathlib import Path
+from typing import Any, Deque, Dict, Optional
+from config.settings import settings
+from core.base_agent import BaseAgent
+from core.base_tool import BaseTool
+from core.metrics import LOOP_BLOCKS, LOOP_LAG
+
+logger = logging.getLogger("loop_watchdog")
+
+PROJECT_ROOT = str(Path(__file__).resolve().parent.parent)
+
+
+def attribute_frame(frame) -> str:
+    """Name the tool or agent running in a stack, else the innermost frame of our own code"""
+    fallback = None
+    while frame is not None:
+        owner = frame.f_locals.get("self")
+        if isinstance(owner, BaseTool):
+            return f"tool:{owner.name}"
+        if isinstance(owner, BaseAgent):
+            return f"agent:{owner.agent_id}"
+        filename = frame.f_code.co_filename
+        if fallback is None and filename.startswith(PROJECT_ROOT) and "loop_watchdog" not in filename:
+            fallback = f"{os.path.relpath(filename, PROJECT_ROOT)}:{frame.f_code.co_name}"
+        frame = frame.f_back
+    return fallback or "unknown"
+
+
+class LoopWatchdog:
+    """Detects event-loop stalls and records what was blocking the loop.
+
+    A heartbeat coroutine stamps the time every interval and records how late it
+    woke (loop lag). A monitor thread notices when the stamp goes stale past the
+    threshold, grabs the loop thread's stack while it is still blocked, and once
+    the loop recovers logs the stall with its duration and culprit to a JSON
+    lines file and to metrics. Only the heartbeat runs on the loop.
+    """
+    def __init__(self, threshold_ms: float = 100.0, interval_ms: float = 20.0, log_path: str = None,
+                 history_size: int = 50):
+        self.threshold = threshold_ms / 1000.0
+        self.interval = interval_ms / 1000.0
+        self.log_path = Path(log_path) if log_path else None
+        self.recent: Deque[Dict[str, Any]] = deque(maxlen=history_size)
+        self.stalls = 0
+        self._last_beat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._pending: Optional[Dict[str, Any]] = None
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._heartbeat is not None
+
+    def start(self):
+        """Start watching the running loop; call from inside it"""
+        if self.running:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self._heartbeat = asyncio.ensure_future(self._beat())
+        self._thread = threading.Thread(target=self._monitor, name="loop-watchdog", daemon=True)
+        self._thread.start()
+        logger.info(f"Event-loop watchdog started (threshold {self.threshold * 1000:.0f}ms)")
+
+    async def stop(self):
+        if not self.running:
+            return
+        self._stop.set()
+        self._heartbeat.cancel()
+        try:
+            await self._heartbeat
+        except asyncio.CancelledError:
+            pass
+        self._heartbeat = None
+
+    async def _beat(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            scheduled = loop.time()
+            await asyncio.sleep(self.interval)
+            LOOP_LAG.observe(max(0.0, loop.time() - scheduled - self.interval))
+            self._last_beat = time.monotonic()
+
+    def _monitor(self):
+        check_every = min(self.interval, self.threshold / 4)
+        while not self._stop.wait(check_every):
+            last_beat = self._last_beat
+            if self._pending is None:
+                if time.monotonic() - last_beat > self.threshold:
+                    self._capture(last_beat)
+            elif last_beat > self._pending["stalled_since"]:
+                self._report(last_beat)
+
+    def _capture(self, last_beat: float):
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return
+        self._pending = {
+            "stalled_since": last_beat,
+            "culprit": attribute_frame(frame),
+            "stack": traceback.format_stack(frame)[-15:]
+        }
+
+    def _report(self, recovered_at: float):
+        pending, self._pending = self._pending, None
+        blocked = max(0.0, recovered_at - pending["stalled_since"] - self.interval)
+        event = {
+            "time": time.time(),
+            "blocked_ms": round(blocked * 1000, 1),
+            "culprit": pending["culprit"],
+            "stack": "".join(pending["stack"])
+        }
+        self.stalls += 1
+        self.recent.append(event)
+        LOOP_BLOCKS.inc(culprit=event["culprit"])
+        logger.warning(f"Event loop blocked for {event['blocked_ms']}ms by {event['culprit']}")
+        if self.log_path is not None:
+            try:
+                self.log_path.parent.mkdir(parents=True, exist_ok=True)
+                with self.log_path.open("a", encoding="utf-8") as f:
+                    f.write(json.dumps(event) + "\n")
+            except Exception as e:
+                logger.warning(f"Could not write loop stall to {self.log_path}: {str(e)}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.running,
+            "threshold_ms": self.threshold * 1000,
+            "stalls": self.stalls,
+            "recent": [{key: value for key, value in event.items() if key != "stack"} for event in self.recent]
+        }
+
+
+loop_watchdog = LoopWatchdog(
+    threshold_ms=settings.loop_watchdog_threshold_ms,
+    interval_ms=settings.loop_watchdog_interval_ms,
+    log_path=settings.loop_watchdog_log_path
+)
@@ -0,0 +1,129 @@
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Set, Tuple
+
+
+@dataclass
+class QueryFeatures:
+    """Keyword matches for one query, grouped by the table that registered them"""
+    query: str
+    lowered: str
+    matches: Dict[str, Set[str]] = field(default_factory=dict)
+
+    def has(self, table: str) -> bool:
+        return bool(self.matches.get(table))
+
+    def count(self, table: str) -> int:
+        return len(self.matches.get(table, ()))
+
+    def matched(self, table: str) -> Set[str]:
+        return self.matches.get(table, set())
+
+
+class _Automaton:
+    """Aho-Corasick automaton over lowercase keywords"""
+    def __init__(self, keywords: Iterable[str]):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[List[str]] = [[]]
+
+        for keyword in keywords:
+            state = 0
+            for char in keyword:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][char] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                state = next_state
+            self.output[state].append(keyword)
+
+        # Breadth-first pass to build failure links, then fold them into a
+        # full transition table so scanning is one dict lookup per character
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(char, 0)
+                self.fail[next_state] = target if target != next_state else 0
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+        self.delta: List[Dict[str, int]] = [dict(self.goto[0])]
+        self.delta.extend({} for _ in range(len(self.goto) - 1))
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            transitions = dict(self.delta[self.fail[state]])
+            transitions.update(self.goto[state])
+            self.delta[state] = transitions
+            queue.extend(self.goto[state].values())
+
+    def find(self, text: str) -> Iterable[Tuple[int, str]]:
+        """Yield (end_index, keyword) for every occurrence in text"""
+        state = 0
+        delta, output = self.delta, self.output
+        for index, char in enumerate(text):
+            state = delta[state].get(char, 0)
+            if output[state]:
+                for keyword in output[state]:
+                    yield index, keyword
+
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char == '_'
+
+
+class QueryFeatureExtractor:
+    """Single-pass multi-table keyword matcher shared by all agents.
+
+    Agents register their keyword tables at startup; one compiled automaton
+    then scans each query once. Matches must start and end on a word boundary
+    (a trailing plural "s" is tolerated) unless the keyword edge is a symbol.
+    """
+    def __init__(self):
+        self._tables: Dict[str, List[str]] = {}
+        self._keyword_tables: Dict[str, List[str]] = {}
+        self._automaton = None
+
+    def register(self, table: str, keywords: Iterable[str]):
+        self._tables[table] = [keyword.lower() for keyword in keywords]
+        self._automaton = None
+
+    def compile(self):
+        keyword_tables: Dict[str, List[str]] = {}
+        for table, keywords in self._tables.items():
+            for keyword in keywords:
+                keyword_tables.setdefault(keyword, []).append(table)
+        self._keyword_tables = keyword_tables
+        self._automaton = _Automaton(keyword_tables)
+
+    def _on_boundary(self, text: str, keyword: str, end: int) -> bool:
+        start = end - len(keyword) + 1
+        if _is_word_char(keyword[0]) and start > 0 and _is_word_char(text[start - 1]):
+            return False
+        if _is_word_char(keyword[-1]) and end + 1 < len(text) and _is_word_char(text[end + 1]):
+            # Allow simple plurals such as "equations" or "constants"
+            plural_end = end + 2
+            return text[end + 1] == 's' and (plural_end == len(text) or not _is_word_char(text[plural_end]))
+        return True
+
+    def extract(self, query: str) -> QueryFeatures:
+        if self._automaton is None:
+            self.compile()
+
+        lowered = query.lower()
+        matches: Dict[str, Set[str]] = {}
+        for end, keyword in self._automaton.find(lowered):
+            if self._on_boundary(lowered, keyword, end):
+                for table in self._keyword_tables[keyword]:
+                    matches.setdefault(table, set()).add(keyword)
+        return QueryFeatures(query=query, lowered=lowered, matches=matches)
+
+
+feature_extractor = QueryFeatureExtractor()
@@ -0,0 +1,181 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency limiter.
+
+    The limit grows by roughly one slot per window of calls that finish within
+    the latency target, and is cut multiplicatively on errors or slow calls.
+    Callers over the limit queue until a slot frees up.
+    """
+    def __init__(self, max_limit: int, min_limit: int = 1, latency_target: float = 8.0,
+                 backoff: float = 0.7, decrease_cooldown: float = 1.0):
+        self.max_limit = max_limit
+        self.min_limit = min(min_limit, max_limit)
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.decrease_cooldown = decrease_cooldown
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self.latency_ewma: Optional[float] = None
+        self.error_rate = 0.0
+        self._last_decrease = 0.0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def current_limit(self) -> int:
+        return max(int(self.limit), 1)
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def set_max_limit(self, max_limit: int):
+        self.max_limit = max_limit
+        self.min_limit = min(self.min_limit, max_limit)
+        self.limit = min(self.limit, float(max_limit))
+        self._wake()
+
+    async def acquire(self):
+        while self.in_flight >= self.current_limit:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                else:
+                    # We were woken but will not use the slot; pass it on
+                    self._wake()
+                raise
+        self.in_flight += 1
+
+    def release(self, latency: Optional[float] = None, success: bool = True, measured: bool = True):
+        self.in_flight -= 1
+        if measured:
+            self._adjust(latency, success)
+        self._wake()
+
+    def _adjust(self, latency: Optional[float], success: bool):
+        if latency is not None:
+            self.latency_ewma = latency if self.latency_ewma is None else 0.8 * self.latency_ewma + 0.2 * latency
+        self.error_rate = 0.9 * self.error_rate + 0.1 * (0.0 if success else 1.0)
+
+        if success and (latency is None or latency <= self.latency_target):
+            # Additive increase: about +1 per limit-sized window of good calls
+            self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+            return
+
+        # Multiplicative decrease, at most once per cooldown so one burst of failures does not collapse the limit
+        now = time.monotonic()
+        if now - self._last_decrease >= self.decrease_cooldown:
+            self.limit = max(float(self.min_limit), self.limit * self.backoff)
+            self._last_decrease = now
+
+    def _wake(self):
+        free = self.current_limit - self.in_flight
+        while free > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    def get_state(self) -> Dict[str, Any]:
+        return {
+            "limit": round(self.limit, 2),
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "latency_target_seconds": self.latency_target,
+            "latency_ewma_seconds": round(self.latency_ewma, 4) if self.latency_ewma is not None else None,
+            "error_rate": round(self.error_rate, 4)
+        }
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker driven by the failure rate over recent calls"""
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_rate_threshold: float = 0.5, min_calls: int = 10, window: int = 20,
+                 reset_timeout: float = 30.0, half_open_max_calls: int = 1):
+        self.failure_rate_threshold = failure_rate_threshold
+        self.min_calls = min_calls
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.state = self.CLOSED
+        self.opened_at: Optional[float] = None
+        self.rejected = 0
+        self.times_opened = 0
+        self._results: Deque[bool] = deque(maxlen=window)
+        self._probes = 0
+
+    @property
+    def failure_rate(self) -> float:
+        if not self._results:
+            return 0.0
+        return self._results.count(False) / len(self._results)
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                self.rejected += 1
+                return False
+            self.state = self.HALF_OPEN
+            self._probes = 0
+
+        if self.state == self.HALF_OPEN:
+            if self._probes >= self.half_open_max_calls:
+                self.rejected += 1
+                return False
+            self._probes += 1
+        return True
+
+    def record_success(self):
+        if self.state == self.HALF_OPEN:
+            self._close()
+        else:
+            self._results.append(True)
+
+    def record_failure(self):
+        if self.state == self.HALF_OPEN:
+            self._open()
+            return
+        self._results.append(False)
+        if len(self._results) >= self.min_calls and self.failure_rate >= self.failure_rate_threshold:
+            self._open()
+
+    def record_cancelled(self):
+        """A call that ended without a verdict (e.g. caller cancelled) frees its probe slot"""
+        if self.state == self.HALF_OPEN and self._probes > 0:
+            self._probes -= 1
+
+    def _open(self):
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+
+    def _close(self):
+        self.state = self.CLOSED
+        self.opened_at = None
+        self._results.clear()
+
+    def get_state(self) -> Dict[str, Any]:
+        retry_in = None
+        if self.state == self.OPEN:
+            retry_in = round(max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at)), 2)
+        return {
+            "state": self.state,
+            "failure_rate": round(self.failure_rate, 4),
+            "recent_calls": len(self._results),
+            "failure_rate_threshold": self.failure_rate_threshold,
+            "rejected": self.rejected,
+            "times_opened": self.times_opened,
+            "retry_in_seconds": retry_in
+        }
@@ -0,0 +1,110 @@
+import hashlib
+import json
+import logging
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from config.settings import settings
+from core.state_manager import state_manager
+
+logger = logging.getLogger("response_cache")
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation"""
+    query = re.sub(r'\s+', ' ', query.lower()).strip()
+    return query.rstrip('?!. ')
+
+
+class ResponseCache:
+    """Two-tier LLM response cache: per-process LRU in front of the shared Redis"""
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600, redis_ttl_seconds: int = 86400):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.redis_ttl_seconds = redis_ttl_seconds
+        self.enabled = settings.response_cache_enabled
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self.stats = {"local_hits": 0, "redis_hits": 0, "misses": 0, "bypassed": 0, "stores": 0}
+
+    @staticmethod
+    def make_key(agent_id: str, template: str, prompt_version: str, query: str, tool_results: List[str] = None,
+                 history: str = "") -> str:
+        payload = json.dumps([agent_id, template, prompt_version, normalize_query(query), tool_results or [], history])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _get_local(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _set_local(self, key: str, value: str):
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+
+        value = self._get_local(key)
+        if value is not None:
+            self.stats["local_hits"] += 1
+            return value
+
+        if state_manager.use_redis:
+            try:
+                value = await state_manager.redis_client.get(f"llmcache:{key}")
+            except Exception as e:
+                logger.warning(f"Redis error in response cache get: {str(e)}")
+                value = None
+            if value is not None:
+                value = value.decode("utf-8")
+                self.stats["redis_hits"] += 1
+                self._set_local(key, value)
+                return value
+
+        self.stats["misses"] += 1
+        return None
+
+    async def set(self, key: str, value: str):
+        if not self.enabled or not value:
+            return
+
+        self._set_local(key, value)
+        self.stats["stores"] += 1
+        if state_manager.use_redis:
+            try:
+                await state_manager.redis_client.setex(f"llmcache:{key}", self.redis_ttl_seconds, value)
+            except Exception as e:
+                logger.warning(f"Redis error in response cache set: {str(e)}")
+
+    def record_bypass(self):
+        self.stats["bypassed"] += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def get_stats(self) -> Dict[str, object]:
+        hits = self.stats["local_hits"] + self.stats["redis_hits"]
+        lookups = hits + self.stats["misses"]
+        return {
+            **self.stats,
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0
+        }
+
+
+response_cache = ResponseCache(
+    max_entries=settings.response_cache_max_entries,
+    ttl_seconds=settings.response_cache_ttl_seconds,
+    redis_ttl_seconds=settings.response_cache_redis_ttl_seconds
+)
@@ -0,0 +1,134 @@
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from config.settings import settings
+
+# Identifies this process in invalidation messages so it can ignore its own writes
+WORKER_ID = uuid.uuid4().hex[:12]
+
+
+class SessionCache:
+    """Per-worker L1 cache of session metadata and the recent history window.
+
+    Entries hold the latest `window` messages plus their history offset. This
+    worker's own commits are applied in place when the seq returned by Redis
+    shows no other writer got in between; otherwise, and whenever another
+    worker announces a write over pub/sub, the entry is dropped. A Redis read
+    is only cached if no write to that session was seen while it was in
+    flight. A short TTL bounds staleness if an invalidation message is lost.
+    """
+    def __init__(self, max_entries: int = 2048, ttl_seconds: float = 30.0, window: int = 50, max_history: int = 0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # Never cache more than the store retains, or an entry could claim history Redis already trimmed
+        self.window = min(window, max_history) if max_history else window
+        self.enabled = settings.session_cache_enabled
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        # Sessions with reads in flight: [reads, writes seen since the first of them started]
+        self._loading: Dict[str, List[int]] = {}
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0, "local_updates": 0, "stale_loads": 0}
+
+    def get(self, session_id: str, history_limit: Optional[int]) -> Optional[Dict[str, Any]]:
+        """A copy of the cached session if the entry covers the requested history"""
+        if not self.enabled:
+            return None
+        entry = self._entries.get(session_id)
+        if entry is not None and entry[0] < time.monotonic():
+            del self._entries[session_id]
+            entry = None
+        if entry is not None:
+            session = entry[1]
+            history = session["conversation_history"]
+            complete = session["history_offset"] == 0
+            if (history_limit is None and complete) or (history_limit is not None and (history_limit <= len(history) or complete)):
+                self._entries.move_to_end(session_id)
+                self.stats["hits"] += 1
+                recent = history if history_limit is None else history[len(history) - min(history_limit, len(history)):]
+                return {**session, "context": dict(session["context"]), "conversation_history": recent,
+                        "history_offset": session["history_offset"] + len(history) - len(recent)}
+        self.stats["misses"] += 1
+        return None
+
+    def put(self, session_id: str, session: Dict[str, Any]):
+        if not self.enabled:
+            return
+        history = session["conversation_history"]
+        recent = history[-self.window:] if self.window > 0 else []
+        cached = {**session, "context": dict(session["context"]), "conversation_history": list(recent),
+                  "history_offset": session["history_offset"] + len(history) - len(recent)}
+        self._entries[session_id] = (time.monotonic() + self.ttl_seconds, cached)
+        self._entries.move_to_end(session_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def begin_load(self, session_id: str) -> int:
+        """Call before reading a session from Redis; pass the token to end_load"""
+        loading = self._loading.setdefault(session_id, [0, 0])
+        loading[0] += 1
+        return loading[1]
+
+    def end_load(self, session_id: str, token: int, session: Optional[Dict[str, Any]]):
+        """Cache a finished read unless the session was written while it was in flight"""
+        loading = self._loading[session_id]
+        loading[0] -= 1
+        if loading[0] == 0:
+            del self._loading[session_id]
+        if session is None:
+            return
+        if loading[1] != token:
+            self.stats["stale_loads"] += 1
+            return
+        self.put(session_id, session)
+
+    def _written(self, session_id: str):
+        loading = self._loading.get(session_id)
+        if loading is not None:
+            loading[1] += 1
+
+    def apply_commit(self, session_id: str, messages: List[Dict[str, Any]], context_updates: Dict[str, Any], seq: int):
+        """Fold this worker's own write into the entry, or drop it if another write interleaved"""
+        self._written(session_id)
+        entry = self._entries.get(session_id)
+        if entry is None:
+            return
+        session = entry[1]
+        history = session["conversation_history"]
+        if session["history_offset"] + len(history) + len(messages) != seq:
+            self.invalidate(session_id)
+            return
+        history.extend(messages)
+        if len(history) > self.window:
+            dropped = len(history) - self.window
+            del history[:dropped]
+            session["history_offset"] += dropped
+        session["context"].update(context_updates or {})
+        self._entries[session_id] = (time.monotonic() + self.ttl_seconds, session)
+        self.stats["local_updates"] += 1
+
+    def invalidate(self, session_id: str):
+        self._written(session_id)
+        if self._entries.pop(session_id, None) is not None:
+            self.stats["invalidations"] += 1
+
+    def clear(self):
+        self._entries.clear()
+        for loading in self._loading.values():
+            loading[1] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0
+        }
+
+
+session_cache = SessionCache(
+    max_entries=settings.session_cache_max_entries,
+    ttl_seconds=settings.session_cache_ttl_seconds,
+    window=settings.context_history_messages,
+    max_history=settings.session_history_max_messages
+)
@@ -0,0 +1,110 @@
+import json
+import zlib
+from datetime import datetime
+from typing import Any, Dict, Union
+from config.settings import settings
+
+try:
+    import msgpack
+except ImportError:  # optional: compact JSON is used instead
+    msgpack = None
+
+# Encoded values start with a zero byte (never the first byte of JSON text), then the
+# format version and flags. Anything else is read as a legacy JSON document.
+MARKER = 0x00
+VERSION = 1
+FLAG_MSGPACK = 0x01
+FLAG_ZLIB = 0x02
+
+
+class CodecError(ValueError):
+    pass
+
+
+class SessionCodec:
+    """Versioned compact encoding for stored session data.
+
+    Values are msgpack (or compact JSON when msgpack is not installed) behind a
+    three-byte header, zlib-compressed above a size threshold. History entries
+    are stored as [role, message, epoch milliseconds] rather than a dict with an
+    ISO timestamp string. decode() also accepts the plain JSON written by
+    earlier versions, so existing sessions are read transparently.
+    """
+    def __init__(self, compress_threshold: int = 1024, compress_level: int = 1, use_msgpack: bool = True):
+        self.compress_threshold = compress_threshold
+        self.compress_level = compress_level
+        self.use_msgpack = use_msgpack and msgpack is not None
+
+    def encode(self, value: Any) -> bytes:
+        flags = 0
+        if self.use_msgpack:
+            payload = msgpack.packb(value, use_bin_type=True)
+            flags |= FLAG_MSGPACK
+        else:
+            payload = json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+        if self.compress_threshold and len(payload) >= self.compress_threshold:
+            compressed = zlib.compress(payload, self.compress_level)
+            if len(compressed) < len(payload):
+                payload = compressed
+                flags |= FLAG_ZLIB
+        return bytes((MARKER, VERSION, flags)) + payload
+
+    def decode(self, data: Union[bytes, str]) -> Any:
+        if isinstance(data, str):
+            return json.loads(data)
+        if not data or data[0] != MARKER:
+            return json.loads(data)
+        if len(data) < 3 or data[1] != VERSION:
+            raise CodecError(f"Unsupported session encoding version {data[1] if len(data) > 1 else None}")
+        flags, payload = data[2], data[3:]
+        if flags & FLAG_ZLIB:
+            payload = zlib.decompress(payload)
+        if flags & FLAG_MSGPACK:
+            if msgpack is None:
+                raise CodecError("Session data is msgpack-encoded but msgpack is not installed")
+            return msgpack.unpackb(payload, raw=False)
+        return json.loads(payload)
+
+    def encode_message(self, entry: Dict[str, Any]) -> bytes:
+        return self.encode([entry["role"], entry["message"], _to_epoch_ms(entry["timestamp"])])
+
+    def decode_message(self, data: Union[bytes, str]) -> Dict[str, Any]:
+        value = self.decode(data)
+        if isinstance(value, dict):
+            return value
+        role, message, timestamp = value
+        return {"role": role, "message": message, "timestamp": _from_epoch_ms(timestamp)}
+
+    def encode_metadata(self, data: Dict[str, Any]) -> bytes:
+        if "created_at" in data:
+            data = {**data, "created_at": _to_epoch_ms(data["created_at"])}
+        return self.encode(data)
+
+    def decode_metadata(self, data: Union[bytes, str]) -> Dict[str, Any]:
+        value = self.decode(data)
+        if "created_at" in value:
+            value["created_at"] = _from_epoch_ms(value["created_at"])
+        return value
+
+
+def _to_epoch_ms(timestamp: Union[str, int]) -> Union[str, int]:
+    if not isinstance(timestamp, str):
+        return timestamp
+    try:
+        return int(datetime.fromisoformat(timestamp).timestamp() * 1000)
+    except ValueError:
+        # Not ISO formatted; kept as written
+        return timestamp
+
+
+def _from_epoch_ms(timestamp: Union[str, int]) -> str:
+    if not isinstance(timestamp, int):
+        return timestamp
+    # Callers see the same naive local ISO strings the timestamps were created as
+    return datetime.fromtimestamp(timestamp / 1000).isoformat(timespec="milliseconds")
+
+
+session_codec = SessionCodec(
+    compress_threshold=settings.session_compress_threshold_bytes,
+    use_msgpack=settings.session_codec_msgpack
+)
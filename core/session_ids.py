@@ -0,0 +1,21 @@
+import re
+import secrets
+import time
+import zlib
+from typing import Optional
+
+# session_<48-bit ms timestamp><64 random bits>_<16-bit shard key>, all lowercase hex.
+# IDs sort by creation time and two sessions created in the same millisecond still differ.
+SESSION_ID_PATTERN = re.compile(r"^session_([0-9a-f]{12})([0-9a-f]{16})_([0-9a-f]{4})$")
+
+
+def new_session_id(user_id: Optional[str] = None) -> str:
+    """Unique, time-ordered session ID; a user's sessions share a shard key"""
+    shard = zlib.crc32(user_id.encode("utf-8")) & 0xFFFF if user_id else secrets.randbits(16)
+    return f"session_{int(time.time() * 1000):012x}{secrets.randbits(64):016x}_{shard:04x}"
+
+
+def shard_key(session_id: str) -> Optional[str]:
+    """The shard key embedded in a session ID, or None for IDs from before shard keys"""
+    match = SESSION_ID_PATTERN.match(session_id)
+    return match.group(3) if match else None
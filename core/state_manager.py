@@ -1,184 +1,831 @@
+import asyncio
+import heapq
 import json
 import redis
+import redis.asyncio as aioredis
 import logging
-from typing import Dict, Any, Optional, List
+import random
+from collections import OrderedDict
+from typing import Dict, Any, Optional, List, Tuple
 from datetime import datetime, timedelta
 import time
 import os
+import functools
 from config.settings import settings
+from core.metrics import STATE_LATENCY, STATE_FALLBACKS, STATE_CONFLICTS
+from core.tracing import tracer
+from core.session_cache import session_cache, WORKER_ID
+from core.session_codec import session_codec
+from core.session_ids import new_session_id, shard_key
+from core.hash_ring import HashRing
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("state_manager")
 
+SESSION_TTL = timedelta(hours=24)
+
+# Optimistic update_session attempts before giving up on a busy session
+UPDATE_ATTEMPTS = 5
+
+# Pub/sub channel on which writers announce "<worker id>:<session id>" to other workers' L1 caches
+INVALIDATION_CHANNEL = "session-invalidations"
+
+# Commit messages and context updates to a session in one round trip, only if the
+# session exists in the current layout ({-1, 0} otherwise). ARGV: history cap, TTL,
+# message count, invalidation channel and payload, expected seq (-1 for none), the
+# encoded messages, then field/value pairs for the metadata hash. "seq" counts every
+# message ever appended and doubles as the session version: messages are always
+# appended, but the hash fields are only written if seq still equals the expected
+# value. The list is trimmed to the cap, both keys' TTLs are refreshed and other
+# workers' L1 caches are told to drop the session. Returns {new seq, 1 if the
+# fields were written else 0}.
+COMMIT_SCRIPT = """
+if redis.call('TYPE', KEYS[1]).ok ~= 'hash' then
+    return {-1, 0}
+end
+local count = tonumber(ARGV[3])
+local seq = tonumber(redis.call('HGET', KEYS[1], 'seq') or '0')
+local expected = tonumber(ARGV[6])
+local apply = expected < 0 or expected == seq
+if count > 0 then
+    local length = redis.call('RPUSH', KEYS[2], unpack(ARGV, 7, 6 + count))
+    seq = redis.call('HINCRBY', KEYS[1], 'seq', count)
+    local cap = tonumber(ARGV[1])
+    if cap > 0 and length > cap then
+        redis.call('LTRIM', KEYS[2], -cap, -1)
+    end
+    redis.call('EXPIRE', KEYS[2], ARGV[2])
+end
+if apply and #ARGV > 6 + count then
+    redis.call('HSET', KEYS[1], unpack(ARGV, 7 + count))
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+if ARGV[5] ~= '' then
+    redis.call('PUBLISH', ARGV[4], ARGV[5])
+end
+return {seq, apply and 1 or 0}
+"""
+
+# One page of history by absolute position, computed against the current seq so a
+# concurrent append cannot shift it. ARGV: page size, then "after" or "before" and the
+# cursor (exclusive), or "latest". Returns {seq, first retained position, position of
+# the first returned message, messages}; seq is -1 if the session does not exist.
+PAGE_SCRIPT = """
+local seq = tonumber(redis.call('HGET', KEYS[1], 'seq') or '-1')
+if seq < 0 then
+    return {-1, 0, 0, {}}
+end
+local first = seq - redis.call('LLEN', KEYS[2])
+local limit = tonumber(ARGV[1])
+local start, stop
+if ARGV[2] == 'after' then
+    start = math.max(tonumber(ARGV[3]) + 1, first)
+    stop = math.min(start + limit, seq)
+else
+    stop = seq
+    if ARGV[2] == 'before' then
+        stop = math.max(math.min(tonumber(ARGV[3]), seq), first)
+    end
+    start = math.max(stop - limit, first)
+end
+if stop <= start then
+    return {seq, first, start, {}}
+end
+return {seq, first, start, redis.call('LRANGE', KEYS[2], start - first, stop - first - 1)}
+"""
+
+
+class SessionConflictError(Exception):
+    """A session kept changing under a read-modify-write; the caller may retry later"""
+    pass
+
+
+def history_entry(role: str, message: str) -> Dict[str, Any]:
+    return {
+        "role": role,
+        "message": message,
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+def page_bounds(first: int, total: int, limit: int, before: Optional[int] = None,
+                after: Optional[int] = None) -> Tuple[int, int]:
+    """[start, stop) positions of a history page; same rules as PAGE_SCRIPT"""
+    if after is not None:
+        start = max(after + 1, first)
+        stop = min(start + limit, total)
+    else:
+        stop = total if before is None else max(min(before, total), first)
+        start = max(stop - limit, first)
+    return start, max(start, stop)
+
+
+def history_page(messages: List[Dict[str, Any]], start: int, first: int, total: int) -> Dict[str, Any]:
+    """Page of messages tagged with their positions, for cursors like ?before=<position>"""
+    return {
+        "conversation_history": [{**message, "position": start + index} for index, message in enumerate(messages)],
+        "history_offset": start,
+        "first_available": first,
+        "total_messages": total
+    }
+
 class InMemoryStateManager:
-    """In-memory fallback when Redis is unavailable"""
-    def __init__(self):
-        self.sessions = {}
+    """Bounded in-memory fallback when Redis is unavailable.
+
+    Sessions are kept in LRU order and capped at max_sessions, evicting the least
+    recently used. Writes refresh a session's expiry like a Redis TTL, and a heap of
+    (deadline, session_id) lets a background sweeper drop expired sessions without
+    scanning them all; heap entries superseded by a later refresh are skipped.
+    """
+    def __init__(self, max_sessions: int = 10000, max_history: int = 0,
+                 ttl_seconds: float = SESSION_TTL.total_seconds(), sweep_interval: float = 60.0):
+        self.sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.max_sessions = max_sessions
+        self.max_history = max_history
+        self.ttl_seconds = ttl_seconds
+        self.sweep_interval = sweep_interval
+        self._deadlines: Dict[str, float] = {}
+        self._expiry_heap: List[Tuple[float, str]] = []
+        self._history_bytes: Dict[str, int] = {}
+        self._sweeper: Optional[asyncio.Task] = None
+        self.stats = {"evicted": 0, "expired": 0, "trimmed_messages": 0}
         logger.info("Using in-memory session storage (Redis unavailable)")
     
-    async def create_session(self, user_id: str = None) -> str:
-        session_id = f"session_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{user_id or 'anonymous'}"
-        self.sessions[session_id] = {
+    @staticmethod
+    def _message_size(encoded: bytes) -> int:
+        # Encoded bytes plus a rough allowance for the bytes object itself
+        return len(encoded) + 33
+    
+    def _touch(self, session_id: str):
+        deadline = time.monotonic() + self.ttl_seconds
+        self._deadlines[session_id] = deadline
+        heapq.heappush(self._expiry_heap, (deadline, session_id))
+        self.sessions[session_id]["expires_at"] = (datetime.now() + timedelta(seconds=self.ttl_seconds)).isoformat()
+        self.sessions.move_to_end(session_id)
+        if len(self._expiry_heap) > 2 * len(self._deadlines) + 64:
+            self._expiry_heap = [(deadline, key) for key, deadline in self._deadlines.items()]
+            heapq.heapify(self._expiry_heap)
+    
+    def _remove(self, session_id: str):
+        self.sessions.pop(session_id, None)
+        self._deadlines.pop(session_id, None)
+        self._history_bytes.pop(session_id, None)
+    
+    def _lookup(self, session_id: str) -> Optional[Dict[str, Any]]:
+        session = self.sessions.get(session_id)
+        if session is None:
+            return None
+        if self._deadlines[session_id] <= time.monotonic():
+            self._remove(session_id)
+            self.stats["expired"] += 1
+            return None
+        self.sessions.move_to_end(session_id)
+        return session
+    
+    def _store(self, session_id: str, session: Dict[str, Any]):
+        self.sessions[session_id] = session
+        self._history_bytes[session_id] = sum(self._message_size(entry) for entry in session["conversation_history"])
+        self._touch(session_id)
+        while len(self.sessions) > self.max_sessions:
+            evicted, _ = self.sessions.popitem(last=False)
+            self._remove(evicted)
+            self.stats["evicted"] += 1
+    
+    @staticmethod
+    def _new_session() -> Dict[str, Any]:
+        return {
             "created_at": datetime.now().isoformat(),
             "conversation_history": [],
+            "history_offset": 0,
             "context": {},
-            "active": True,
-            "expires_at": (datetime.now() + timedelta(hours=24)).isoformat()
+            "active": True
         }
+    
+    def sweep(self) -> int:
+        """Drop every session whose expiry has passed; returns how many were removed"""
+        now = time.monotonic()
+        removed = 0
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            deadline, session_id = heapq.heappop(self._expiry_heap)
+            if self._deadlines.get(session_id) == deadline:
+                self._remove(session_id)
+                removed += 1
+        self.stats["expired"] += removed
+        return removed
+    
+    async def _sweep_periodically(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            removed = self.sweep()
+            if removed:
+                logger.info(f"Expired {removed} in-memory sessions")
+    
+    def _ensure_sweeper(self):
+        if self._sweeper is None:
+            self._sweeper = asyncio.get_running_loop().create_task(self._sweep_periodically())
+    
+    async def stop(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+    
+    async def create_session(self, user_id: str = None) -> str:
+        self._ensure_sweeper()
+        session_id = new_session_id(user_id)
+        self._store(session_id, self._new_session())
         return session_id
     
-    async def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
-        session = self.sessions.get(session_id)
-        if session and datetime.fromisoformat(session["expires_at"]) < datetime.now():
-            del self.sessions[session_id]
+    async def get_session(self, session_id: str, history_limit: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Session with decoded history; history entries are held encoded by the session codec"""
+        session = self._lookup(session_id)
+        if session is None:
             return None
-        return session
+        history = session["conversation_history"]
+        recent = history if history_limit is None else history[len(history) - min(max(history_limit, 0), len(history)):]
+        return {**session, "conversation_history": [session_codec.decode_message(entry) for entry in recent],
+                "history_offset": session["history_offset"] + len(history) - len(recent)}
+    
+    async def get_history_page(self, session_id: str, limit: int, before: Optional[int] = None,
+                               after: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        session = self._lookup(session_id)
+        if session is None:
+            return None
+        history = session["conversation_history"]
+        first = session["history_offset"]
+        total = first + len(history)
+        start, stop = page_bounds(first, total, limit, before, after)
+        messages = [session_codec.decode_message(entry) for entry in history[start - first:stop - first]]
+        return history_page(messages, start, first, total)
     
     async def update_session(self, session_id: str, data: Dict[str, Any]):
-        if session_id in self.sessions:
-            self.sessions[session_id].update(data)
+        session = self._lookup(session_id)
+        if session is not None:
+            data = {key: value for key, value in data.items() if key != "history_offset"}
+            if "conversation_history" in data:
+                data["conversation_history"] = [session_codec.encode_message(entry) for entry in data["conversation_history"]]
+                data["history_generation"] = session.get("history_generation", 0) + 1
+            session.update(data)
+            if "conversation_history" in data:
+                self._history_bytes[session_id] = sum(self._message_size(entry) for entry in session["conversation_history"])
+            self._touch(session_id)
+    
+    def _append(self, session_id: str, entries: List[Dict[str, Any]]):
+        session = self.sessions[session_id]
+        history = session["conversation_history"]
+        entries = [session_codec.encode_message(entry) for entry in entries]
+        history.extend(entries)
+        added = sum(self._message_size(entry) for entry in entries)
+        if self.max_history and len(history) > self.max_history:
+            dropped = len(history) - self.max_history
+            added -= sum(self._message_size(entry) for entry in history[:dropped])
+            del history[:dropped]
+            session["history_offset"] += dropped
+            self.stats["trimmed_messages"] += dropped
+        self._history_bytes[session_id] += added
+        self._touch(session_id)
     
     async def add_to_history(self, session_id: str, role: str, message: str):
-        if session_id in self.sessions:
-            self.sessions[session_id]["conversation_history"].append({
-                "role": role,
-                "message": message,
-                "timestamp": datetime.now().isoformat()
-            })
+        if self._lookup(session_id) is not None:
+            self._append(session_id, [history_entry(role, message)])
+    
+    async def commit_turn(self, session_id: str, user_msg: str, assistant_msg: str,
+                          context_updates: Optional[Dict[str, Any]] = None, expected_seq: Optional[int] = None) -> bool:
+        session = self._lookup(session_id)
+        if session is None:
+            return False
+        if expected_seq is None or expected_seq == session["history_offset"] + len(session["conversation_history"]):
+            session["context"].update(context_updates or {})
+        elif context_updates:
+            STATE_CONFLICTS.inc(operation="commit_turn")
+        self._append(session_id, [history_entry("user", user_msg), history_entry("assistant", assistant_msg)])
+        return True
     
     async def clear_session(self, session_id: str) -> bool:
         """Clear session data but keep the session ID"""
-        if session_id in self.sessions:
-            self.sessions[session_id] = {
-                "created_at": datetime.now().isoformat(),
-                "conversation_history": [],
-                "context": {},
-                "active": True,
-                "expires_at": (datetime.now() + timedelta(hours=24)).isoformat()
-            }
+        session = self._lookup(session_id)
+        if session is not None:
+            self._store(session_id, {**self._new_session(), "history_generation": session.get("history_generation", 0) + 1})
             return True
         return False
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Size of the store: sessions, retained messages and approximate history bytes"""
+        return {
+            **self.stats,
+            "sessions": len(self.sessions),
+            "max_sessions": self.max_sessions,
+            "history_messages": sum(len(session["conversation_history"]) for session in self.sessions.values()),
+            "approx_history_bytes": sum(self._history_bytes.values()),
+            "expiry_heap_entries": len(self._expiry_heap)
+        }
+
+
+def timed_operation(operation: str):
+    """Record latency per state-manager operation, labelled with the backend that served it"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(self, *args, **kwargs):
+            if not self.connected:
+                await self.connect()
+            backend = "redis" if self.use_redis else "memory"
+            start = time.perf_counter()
+            status = "ok"
+            try:
+                with tracer.span(f"state.{operation}", backend=backend):
+                    return await fn(self, *args, **kwargs)
+            except BaseException:
+                status = "error"
+                raise
+            finally:
+                STATE_LATENCY.observe(time.perf_counter() - start, operation=operation, backend=backend, status=status)
+        return wrapper
+    return decorator
 
 
 class StateManager:
+    """Session storage on async Redis clients, falling back to memory when Redis is unavailable.
+
+    Sessions are spread over one or more Redis nodes (REDIS_URLS) with a
+    consistent-hash ring keyed by the shard key embedded in each session ID;
+    IDs from before shard keys stay on the first configured node. The ring is
+    built from the configured nodes only, so every worker maps a session to
+    the same node; if any node is unreachable at startup the whole store falls
+    back to memory rather than remapping that node's sessions. Changing
+    REDIS_URLS remaps about 1/N of the shard keys, and those sessions are not
+    moved automatically. Nothing touches the network at import time:
+    connect() builds a connection pool per node and pings it on app startup
+    (or on first use), and close() releases the pools.
+    """
     def __init__(self):
-        # Try to connect to Redis, fall back to in-memory if unavailable
-        self.use_redis = True
+        self.use_redis = False
+        self.connected = False
+        self.redis_client: Optional[aioredis.Redis] = None  # first configured node; also used by the response cache
+        self.nodes: Dict[str, aioredis.Redis] = {}
+        self.ring = HashRing(replicas=settings.redis_ring_replicas)
+        self.fallback: Optional[InMemoryStateManager] = None
+        self._commit_script = None
+        self._page_script = None
+        self._invalidation_listeners: List[asyncio.Task] = []
+        self._connect_lock: Optional[asyncio.Lock] = None
+
+    @staticmethod
+    def _node_urls() -> List[str]:
+        urls = [url.strip() for url in settings.redis_urls.split(",") if url.strip()]
+        return urls or [settings.redis_url]
+
+    @staticmethod
+    def _node_name(client: aioredis.Redis) -> str:
+        """Ring identity of a node: its address, so credentials in the URL can change without moving keys"""
+        kwargs = client.connection_pool.connection_kwargs
+        address = kwargs.get("path") or f"{kwargs.get('host', 'localhost')}:{kwargs.get('port', 6379)}"
+        return f"{address}/{kwargs.get('db', 0)}"
+
+    async def connect(self):
+        """Open a pool per Redis node, or switch to in-memory storage if any cannot be reached"""
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if self.connected:
+                return
+            clients: Dict[str, aioredis.Redis] = {}
+            unreachable = []
+            for url in self._node_urls():
+                pool = aioredis.BlockingConnectionPool.from_url(
+                    url,
+                    max_connections=settings.redis_max_connections,
+                    timeout=settings.redis_pool_timeout_seconds,
+                    socket_connect_timeout=settings.redis_connect_timeout_seconds,
+                    socket_timeout=settings.redis_socket_timeout_seconds,
+                    decode_responses=False  # session values are binary (see session_codec)
+                )
+                client = aioredis.Redis(connection_pool=pool)
+                name = self._node_name(client)
+                clients[name] = client
+                try:
+                    # The blocking pool would otherwise keep retrying for its whole checkout timeout
+                    await asyncio.wait_for(client.ping(), settings.redis_connect_timeout_seconds)
+                except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError, asyncio.TimeoutError, OSError) as e:
+                    logger.warning(f"Redis connection to {name} failed: {str(e) or type(e).__name__}")
+                    unreachable.append(name)
+            if unreachable:
+                # Dropping a node from the ring would send its sessions to its neighbours, where they look
+                # missing, and workers started at different times would disagree on the ring
+                logger.warning(f"Redis node(s) {', '.join(unreachable)} unreachable. Using in-memory state manager instead.")
+                STATE_FALLBACKS.inc(operation="connect")
+                for client in clients.values():
+                    await client.aclose(close_connection_pool=True)
+                self.use_redis = False
+                self.fallback = self._new_fallback()
+                self.connected = True
+                return
+            for name, client in clients.items():
+                self.nodes[name] = client
+                self.ring.add_node(name)
+                if self.redis_client is None:
+                    self.redis_client = client
+                    self._commit_script = client.register_script(COMMIT_SCRIPT)
+                    self._page_script = client.register_script(PAGE_SCRIPT)
+                if session_cache.enabled:
+                    self._invalidation_listeners.append(
+                        asyncio.get_running_loop().create_task(self._listen_for_invalidations(client))
+                    )
+            self.use_redis = True
+            logger.info(f"Successfully connected to Redis ({len(self.nodes)} node{'s' if len(self.nodes) > 1 else ''})")
+            self.connected = True
+
+    def _client(self, session_id: str) -> aioredis.Redis:
+        """The node that owns a session"""
+        key = shard_key(session_id)
+        if key is None:
+            return self.redis_client
+        return self.nodes[self.ring.node_for(key)]
+
+    @staticmethod
+    def _new_fallback() -> InMemoryStateManager:
+        return InMemoryStateManager(
+            max_sessions=settings.memory_max_sessions,
+            max_history=settings.session_history_max_messages,
+            sweep_interval=settings.memory_sweep_interval_seconds
+        )
+
+    async def _listen_for_invalidations(self, client: aioredis.Redis):
+        """Drop L1 entries for sessions other workers wrote to this node; resubscribe after errors"""
+        reconnecting = False
+        while True:
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                if reconnecting:
+                    # Entries cached while the subscription was down may have missed invalidations
+                    session_cache.clear()
+                    reconnecting = False
+                while True:
+                    # A bounded wait returns None on a quiet channel; listen() would instead hit the
+                    # pool's socket timeout and look like a disconnect every few seconds
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message is None or message["type"] != "message":
+                        continue
+                    worker_id, _, session_id = message["data"].decode("utf-8").partition(":")
+                    if worker_id != WORKER_ID:
+                        session_cache.invalidate(session_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Invalidations may have been missed while disconnected
+                logger.warning(f"Session invalidation listener error: {str(e)}")
+                session_cache.clear()
+                reconnecting = True
+                await asyncio.sleep(1.0)
+            finally:
+                await pubsub.aclose()
+
+    def _invalidation(self, session_id: str) -> str:
+        return f"{WORKER_ID}:{session_id}" if session_cache.enabled else ""
+
+    async def close(self):
+        """Release the Redis connection pool and stop the in-memory sweeper"""
+        if self.fallback is not None:
+            await self.fallback.stop()
+        for listener in self._invalidation_listeners:
+            listener.cancel()
+        await asyncio.gather(*self._invalidation_listeners, return_exceptions=True)
+        self._invalidation_listeners = []
+        session_cache.clear()
+        for name, client in self.nodes.items():
+            await client.aclose(close_connection_pool=True)
+            self.ring.remove_node(name)
+        self.nodes = {}
         self.redis_client = None
-        try:
-            self.redis_client = redis.from_url(settings.redis_url, decode_responses=True, socket_connect_timeout=2)
-            # Test connection
-            self.redis_client.ping()
-            logger.info("Successfully connected to Redis")
-        except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError) as e:
-            logger.warning(f"Redis connection failed: {str(e)}. Using in-memory state manager instead.")
-            self.use_redis = False
-            self.fallback = InMemoryStateManager()
+        self.use_redis = False
+        self.connected = False
     
-    async def create_session(self, user_id: str = None) -> str:
-        if not self.use_redis:
-            return await self.fallback.create_session(user_id)
-            
-        session_id = f"session_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{user_id or 'anonymous'}"
-        session_data = {
+    def get_stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = {"backend": "redis" if self.use_redis else "memory"}
+        if self.use_redis:
+            stats["redis_nodes"] = self.ring.nodes
+            stats["l1_cache"] = session_cache.get_stats()
+        elif self.fallback is not None:
+            stats["memory"] = self.fallback.get_stats()
+        return stats
+
+    def _fall_back(self, operation: str, error: Exception):
+        logger.error(f"Redis error in {operation}: {str(error)}")
+        STATE_FALLBACKS.inc(operation=operation)
+        self.use_redis = False
+        self.fallback = self._new_fallback()
+        session_cache.clear()
+    
+    @staticmethod
+    def _keys(session_id: str) -> Tuple[str, str]:
+        """Metadata hash and the append-only history list"""
+        return f"session:{session_id}", f"session:{session_id}:history"
+
+    @staticmethod
+    def _new_metadata() -> Dict[str, Any]:
+        return {
             "created_at": datetime.now().isoformat(),
-            "conversation_history": [],
             "context": {},
             "active": True
         }
+
+    @staticmethod
+    def _encode_context(context: Dict[str, Any]) -> Dict[str, bytes]:
+        return {f"ctx:{key}": session_codec.encode(value) for key, value in context.items()}
+
+    @classmethod
+    def _encode_metadata(cls, session: Dict[str, Any]) -> Dict[str, bytes]:
+        """Hash fields: "data" for the fixed metadata, one "ctx:<key>" field per context entry.
+
+        Keeping context entries in their own fields lets a turn update them
+        with a plain HSET instead of reading and rewriting the metadata.
+        """
+        data = {key: value for key, value in session.items()
+                if key not in ("context", "conversation_history", "history_offset")}
+        return {"data": session_codec.encode_metadata(data), **cls._encode_context(session.get("context", {}))}
+
+    @staticmethod
+    def _decode_metadata(meta: Dict[bytes, bytes]) -> Dict[str, Any]:
+        session = session_codec.decode_metadata(meta[b"data"])
+        context = session.setdefault("context", {})
+        for field, value in meta.items():
+            if field.startswith(b"ctx:"):
+                context[field[4:].decode("utf-8")] = session_codec.decode(value)
+        return session
+
+    async def _read(self, session_id: str, history_limit: Optional[int]) -> Tuple[Dict[bytes, bytes], List[bytes]]:
+        meta_key, history_key = self._keys(session_id)
+        async with self._client(session_id).pipeline(transaction=True) as pipe:
+            pipe.hgetall(meta_key)
+            if history_limit is None:
+                pipe.lrange(history_key, 0, -1)
+            elif history_limit > 0:
+                pipe.lrange(history_key, -history_limit, -1)
+            results = await pipe.execute()
+        return results[0], results[1] if len(results) > 1 else []
+
+    async def _migrate_legacy(self, session_id: str) -> bool:
+        """Split a pre-list session (one JSON blob with the history inline) into hash + list"""
+        meta_key, history_key = self._keys(session_id)
+        client = self._client(session_id)
+        if await client.type(meta_key) != b"string":
+            return False
+        legacy = await client.get(meta_key)
+        session = json.loads(legacy)
+        history = session.pop("conversation_history", [])
+        ttl = await client.ttl(meta_key)
+        ttl = ttl if ttl > 0 else int(SESSION_TTL.total_seconds())
+        async with client.pipeline(transaction=True) as pipe:
+            pipe.delete(meta_key, history_key)
+            pipe.hset(meta_key, mapping={**self._encode_metadata(session), "seq": len(history)})
+            if history:
+                pipe.rpush(history_key, *[session_codec.encode_message(message) for message in history])
+                pipe.expire(history_key, ttl)
+            pipe.expire(meta_key, ttl)
+            await pipe.execute()
+        logger.info(f"Migrated legacy session {session_id} ({len(history)} messages)")
+        return True
+
+    async def _commit(self, session_id: str, messages: List[Dict[str, Any]], context_updates: Dict[str, Any] = None,
+                      expected_seq: Optional[int] = None) -> int:
+        meta_key, history_key = self._keys(session_id)
+        fields = [item for pair in self._encode_context(context_updates or {}).items() for item in pair]
+        args = [settings.session_history_max_messages, int(SESSION_TTL.total_seconds()), len(messages),
+                INVALIDATION_CHANNEL, self._invalidation(session_id), -1 if expected_seq is None else expected_seq,
+                *[session_codec.encode_message(message) for message in messages], *fields]
+        client = self._client(session_id)
+        seq, applied = await self._commit_script(keys=[meta_key, history_key], args=args, client=client)
+        if seq == -1 and await self._migrate_legacy(session_id):
+            seq, applied = await self._commit_script(keys=[meta_key, history_key], args=args, client=client)
+        if seq == -1:
+            session_cache.invalidate(session_id)
+            return seq
+        if not applied:
+            # Another writer appended since the caller read the session; its context updates are stale
+            STATE_CONFLICTS.inc(operation="commit_turn")
+            logger.info(f"Session {session_id} moved past seq {expected_seq}; kept the turn, dropped its context updates")
+        session_cache.apply_commit(session_id, messages, context_updates if applied else None, seq)
+        return seq
+
+    async def _load(self, session_id: str, history_limit: Optional[int]) -> Optional[Dict[str, Any]]:
+        """Read a session from Redis, migrating the legacy layout on the way"""
+        try:
+            meta, history = await self._read(session_id, history_limit)
+        except redis.exceptions.ResponseError as e:
+            if "WRONGTYPE" not in str(e):
+                raise
+            await self._migrate_legacy(session_id)
+            meta, history = await self._read(session_id, history_limit)
+        if not meta:
+            return None
+        session = self._decode_metadata(meta)
+        session["conversation_history"] = [session_codec.decode_message(message) for message in history]
+        session["history_offset"] = max(0, int(meta.get(b"seq", 0)) - len(history))
+        return session
+
+    @timed_operation("create_session")
+    async def create_session(self, user_id: str = None) -> str:
+        if not self.use_redis:
+            return await self.fallback.create_session(user_id)
+            
+        session_id = new_session_id(user_id)
+        meta_key, _ = self._keys(session_id)
         
+        session = self._new_metadata()
         try:
-            self.redis_client.setex(
-                f"session:{session_id}",
-                timedelta(hours=24),
-                json.dumps(session_data)
-            )
+            async with self._client(session_id).pipeline(transaction=True) as pipe:
+                pipe.hset(meta_key, mapping={**self._encode_metadata(session), "seq": 0})
+                pipe.expire(meta_key, SESSION_TTL)
+                await pipe.execute()
+            session_cache.put(session_id, {**session, "conversation_history": [], "history_offset": 0})
             return session_id
         except Exception as e:
-            logger.error(f"Redis error in create_session: {str(e)}")
-            self.use_redis = False
-            self.fallback = InMemoryStateManager()
+            self._fall_back("create_session", e)
             return await self.fallback.create_session(user_id)
     
-    async def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+    @timed_operation("get_session")
+    async def get_session(self, session_id: str, history_limit: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Session metadata with its history, or only the latest history_limit messages.
+
+        "history_offset" is the position of the first returned message among all
+        messages ever appended, so callers can tell how many are not included.
+        """
         if not self.use_redis:
-            return await self.fallback.get_session(session_id)
+            return await self.fallback.get_session(session_id, history_limit)
+        
+        cached = session_cache.get(session_id, history_limit)
+        if cached is not None:
+            return cached
             
         try:
-            data = self.redis_client.get(f"session:{session_id}")
-            return json.loads(data) if data else None
+            # Read at least the cache window so the next turn can be served locally
+            read_limit = history_limit if history_limit is None or not session_cache.enabled else max(history_limit, session_cache.window)
+            token = session_cache.begin_load(session_id)
+            session = None
+            try:
+                session = await self._load(session_id, read_limit)
+            finally:
+                # Not cached if an invalidation or local commit landed during the read
+                session_cache.end_load(session_id, token, session)
+            if session is None:
+                return None
+            if read_limit != history_limit:
+                recent = session["conversation_history"][-history_limit:] if history_limit > 0 else []
+                session["history_offset"] += len(session["conversation_history"]) - len(recent)
+                session["conversation_history"] = recent
+            return session
+        except Exception as e:
+            self._fall_back("get_session", e)
+            return await self.fallback.get_session(session_id, history_limit)
+    
+    @timed_operation("get_history_page")
+    async def get_history_page(self, session_id: str, limit: int, before: Optional[int] = None,
+                               after: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Up to `limit` messages after or before a position cursor (exclusive), else the latest.
+
+        Positions count every message ever appended, so cursors stay valid as
+        the session grows and old messages are trimmed.
+        """
+        if not self.use_redis:
+            return await self.fallback.get_history_page(session_id, limit, before, after)
+        
+        mode, cursor = ("after", after) if after is not None else ("before", before) if before is not None else ("latest", 0)
+        keys = list(self._keys(session_id))
+        client = self._client(session_id)
+        try:
+            try:
+                seq, first, start, entries = await self._page_script(keys=keys, args=[limit, mode, cursor], client=client)
+            except redis.exceptions.ResponseError as e:
+                if "WRONGTYPE" not in str(e):
+                    raise
+                await self._migrate_legacy(session_id)
+                seq, first, start, entries = await self._page_script(keys=keys, args=[limit, mode, cursor], client=client)
+            if seq == -1:
+                return None
+            return history_page([session_codec.decode_message(entry) for entry in entries], start, first, seq)
         except Exception as e:
-            logger.error(f"Redis error in get_session: {str(e)}")
-            self.use_redis = False
-            self.fallback = InMemoryStateManager()
-            return await self.fallback.get_session(session_id)
+            self._fall_back("get_history_page", e)
+            return await self.fallback.get_history_page(session_id, limit, before, after)
     
+    @timed_operation("update_session")
     async def update_session(self, session_id: str, data: Dict[str, Any]):
         if not self.use_redis:
             return await self.fallback.update_session(session_id, data)
             
         try:
-            existing = await self.get_session(session_id)
-            if existing:
-                existing.update(data)
-                self.redis_client.setex(
-                    f"session:{session_id}",
-                    timedelta(hours=24),
-                    json.dumps(existing)
-                )
+            meta_key, history_key = self._keys(session_id)
+            history = data.get("conversation_history")
+            async with self._client(session_id).pipeline(transaction=True) as pipe:
+                # Read-modify-write under WATCH: EXEC fails and the update is redone, after a
+                # short jittered pause, if a turn commits between the read and the write
+                for attempt in range(UPDATE_ATTEMPTS):
+                    try:
+                        await pipe.watch(meta_key, history_key)
+                        meta = await pipe.hgetall(meta_key)
+                        if not meta:
+                            return
+                        existing = self._decode_metadata(meta)
+                        stale_context = set(existing["context"])
+                        generation = existing.get("history_generation", 0)
+                        existing.update(data)
+                        if history is not None:
+                            # Replaced rather than appended to, so the message count alone no longer identifies it
+                            existing["history_generation"] = generation + 1
+                        stale_context -= set(existing["context"])
+                        pipe.multi()
+                        if stale_context:
+                            pipe.hdel(meta_key, *[f"ctx:{key}" for key in stale_context])
+                        pipe.hset(meta_key, mapping=self._encode_metadata(existing))
+                        pipe.expire(meta_key, SESSION_TTL)
+                        if history is not None:
+                            pipe.delete(history_key)
+                            pipe.hset(meta_key, "seq", len(history))
+                            if history:
+                                pipe.rpush(history_key, *[session_codec.encode_message(message) for message in history])
+                                pipe.expire(history_key, SESSION_TTL)
+                        if session_cache.enabled:
+                            pipe.publish(INVALIDATION_CHANNEL, self._invalidation(session_id))
+                        await pipe.execute()
+                        break
+                    except redis.exceptions.WatchError:
+                        STATE_CONFLICTS.inc(operation="update_session")
+                        await asyncio.sleep(random.uniform(0, 0.005 * 2 ** attempt))
+                    except redis.exceptions.ResponseError as e:
+                        if "WRONGTYPE" not in str(e):
+                            raise
+                        await pipe.reset()
+                        await self._migrate_legacy(session_id)
+                else:
+                    STATE_CONFLICTS.inc(operation="update_session_gave_up")
+                    raise SessionConflictError(f"Session {session_id} changed on each of {UPDATE_ATTEMPTS} update attempts")
+            session_cache.invalidate(session_id)
+        except SessionConflictError:
+            # Redis is fine; only this update lost out
+            raise
         except Exception as e:
-            logger.error(f"Redis error in update_session: {str(e)}")
-            self.use_redis = False
-            self.fallback = InMemoryStateManager()
+            self._fall_back("update_session", e)
             return await self.fallback.update_session(session_id, data)
     
+    @timed_operation("add_to_history")
     async def add_to_history(self, session_id: str, role: str, message: str):
         if not self.use_redis:
             return await self.fallback.add_to_history(session_id, role, message)
             
         try:
-            session = await self.get_session(session_id)
-            if session:
-                session["conversation_history"].append({
-                    "role": role,
-                    "message": message,
-                    "timestamp": datetime.now().isoformat()
-                })
-                await self.update_session(session_id, session)
+            await self._commit(session_id, [history_entry(role, message)])
         except Exception as e:
-            logger.error(f"Redis error in add_to_history: {str(e)}")
-            self.use_redis = False
-            self.fallback = InMemoryStateManager()
+            self._fall_back("add_to_history", e)
             return await self.fallback.add_to_history(session_id, role, message)
     
+    @timed_operation("commit_turn")
+    async def commit_turn(self, session_id: str, user_msg: str, assistant_msg: str,
+                          context_updates: Optional[Dict[str, Any]] = None, expected_seq: Optional[int] = None) -> bool:
+        """Append a question/answer pair and merge context updates atomically in one round trip.
+
+        Concurrent turns on a session never drop each other's messages: each
+        pair is appended whole, in the order the turns commit. expected_seq is
+        the message count the caller's context updates were derived from; if
+        another turn committed first they are stale and are skipped (the
+        messages are still appended). Returns False when the session no longer exists.
+        """
+        if not self.use_redis:
+            return await self.fallback.commit_turn(session_id, user_msg, assistant_msg, context_updates, expected_seq)
+        
+        messages = [history_entry("user", user_msg), history_entry("assistant", assistant_msg)]
+        try:
+            return await self._commit(session_id, messages, context_updates, expected_seq) != -1
+        except Exception as e:
+            self._fall_back("commit_turn", e)
+            return await self.fallback.commit_turn(session_id, user_msg, assistant_msg, context_updates, expected_seq)
+    
+    @timed_operation("clear_session")
     async def clear_session(self, session_id: str) -> bool:
         """Clear a session's conversation history"""
         if not self.use_redis:
             return await self.fallback.clear_session(session_id)
             
         try:
-            existing = await self.get_session(session_id)
+            existing = await self._load(session_id, 0)
             if existing:
-                # Create fresh session data but keep the ID
-                session_data = {
-                    "created_at": datetime.now().isoformat(),
-                    "conversation_history": [],
-                    "context": {},
-                    "active": True
-                }
-                
-                self.redis_client.setex(
-                    f"session:{session_id}",
-                    timedelta(hours=24),
-                    json.dumps(session_data)
-                )
+                # Fresh metadata and an empty history, keeping the ID
+                meta_key, history_key = self._keys(session_id)
+                async with self._client(session_id).pipeline(transaction=True) as pipe:
+                    pipe.delete(meta_key, history_key)
+                    metadata = {**self._new_metadata(), "history_generation": existing.get("history_generation", 0) + 1}
+                    pipe.hset(meta_key, mapping={**self._encode_metadata(metadata), "seq": 0})
+                    pipe.expire(meta_key, SESSION_TTL)
+                    if session_cache.enabled:
+                        pipe.publish(INVALIDATION_CHANNEL, self._invalidation(session_id))
+                    await pipe.execute()
+                session_cache.invalidate(session_id)
                 return True
             return False
         except Exception as e:
-            logger.error(f"Redis error in clear_session: {str(e)}")
-            self.use_redis = False
-            self.fallback = InMemoryStateManager()
+            self._fall_back("clear_session", e)
             return await self.fallback.clear_session(session_id)
 
 state_manager = StateManager()
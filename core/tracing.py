@@ -0,0 +1,202 @@
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from config.settings import settings
+
+logger = logging.getLogger("tracing")
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """One timed stage of a request; children link to it through parent_id"""
+    __slots__ = ("tracer", "trace_id", "span_id", "parent_id", "name", "attributes", "status",
+                 "start_time", "_start", "duration_ms")
+
+    def __init__(self, tracer: "Tracer", name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.tracer = tracer
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.status = "ok"
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self.duration_ms: Optional[float] = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def end(self, status: Optional[str] = None):
+        if self.duration_ms is not None:
+            return
+        if status is not None:
+            self.status = status
+        self.duration_ms = round((time.perf_counter() - self._start) * 1000, 3)
+        self.tracer._finish(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_time": self.start_time,
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "attributes": self.attributes
+        }
+
+
+class _NoopSpan:
+    trace_id = None
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def end(self, status: Optional[str] = None):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class JsonlSpanExporter:
+    """Appends finished spans as JSON lines from a background thread so the event loop never writes files.
+
+    Once the file reaches max_bytes it is renamed to "<path>.1" (replacing any
+    previous one) and a new file is started, so at most about twice that is kept.
+    """
+    def __init__(self, path: str, max_bytes: int = 0):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, record: Dict[str, Any]):
+        self._queue.put(record)
+
+    def _run(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        while True:
+            batch = [self._queue.get()]
+            # Drain whatever else is waiting so one write covers a burst of spans
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with self.path.open("a", encoding="utf-8") as f:
+                    f.write("".join(json.dumps(record, default=str) + "\n" for record in batch))
+                    size = f.tell()
+                if self.max_bytes and size >= self.max_bytes:
+                    self.path.replace(self.path.with_name(self.path.name + ".1"))
+            except Exception as e:
+                logger.warning(f"Could not export {len(batch)} spans: {str(e)}")
+
+    def flush(self, timeout: float = 2.0):
+        deadline = time.monotonic() + timeout
+        while not self._queue.empty() and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+
+class Tracer:
+    """Context-propagated spans; the active span follows asyncio tasks through contextvars.
+
+    Finished spans go to the exporter and to a small in-memory buffer of recent
+    traces, which backs the waterfall view at /api/traces/{trace_id}.
+    """
+    def __init__(self, enabled: bool = True, exporter: Optional[JsonlSpanExporter] = None, buffer_size: int = 200):
+        self.enabled = enabled
+        self.exporter = exporter
+        self.buffer_size = buffer_size
+        self._recent: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+        # Spans may also finish on executor threads (run_blocking carries the context there)
+        self._lock = threading.Lock()
+
+    def current_span(self):
+        return _current_span.get() or NOOP_SPAN
+
+    def start_span(self, name: str, trace_id: Optional[str] = None, **attributes):
+        """Start a span under the current one without making it current (e.g. across async generator yields)"""
+        if not self.enabled:
+            return NOOP_SPAN
+        parent = _current_span.get()
+        if parent is not None:
+            return Span(self, name, parent.trace_id, parent.span_id, attributes)
+        return Span(self, name, trace_id or uuid.uuid4().hex, None, attributes)
+
+    @contextmanager
+    def span(self, name: str, trace_id: Optional[str] = None, **attributes):
+        """Time the block as a child of the current span and make it current inside the block"""
+        span = self.start_span(name, trace_id, **attributes)
+        if span is NOOP_SPAN:
+            yield span
+            return
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.set_attribute("error", repr(e))
+            span.end("cancelled" if isinstance(e, (asyncio.CancelledError, GeneratorExit)) else "error")
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end()
+
+    @contextmanager
+    def activate(self, span):
+        """Make an already started span current for the duration of the block"""
+        if span is NOOP_SPAN:
+            yield span
+            return
+        token = _current_span.set(span)
+        try:
+            yield span
+        finally:
+            _current_span.reset(token)
+
+    def _finish(self, span: Span):
+        record = span.to_dict()
+        with self._lock:
+            spans = self._recent.get(span.trace_id)
+            if spans is None:
+                spans = self._recent[span.trace_id] = []
+                while len(self._recent) > self.buffer_size:
+                    self._recent.popitem(last=False)
+            spans.append(record)
+        if self.exporter is not None:
+            self.exporter.export(record)
+
+    def get_trace(self, trace_id: str) -> Optional[List[Dict[str, Any]]]:
+        """Spans of a recent trace ordered by start, with offsets from the earliest span"""
+        with self._lock:
+            spans = list(self._recent.get(trace_id, ()))
+        if not spans:
+            return None
+        origin = min(span["start_time"] for span in spans)
+        return [
+            {**span, "offset_ms": round((span["start_time"] - origin) * 1000, 3)}
+            for span in sorted(spans, key=lambda span: span["start_time"])
+        ]
+
+
+tracer = Tracer(
+    enabled=settings.tracing_enabled,
+    exporter=(JsonlSpanExporter(settings.trace_export_path, settings.trace_export_max_bytes)
+              if settings.tracing_enabled and settings.trace_export_path else None),
+    buffer_size=settings.trace_buffer_size
+)
@@ -1,8 +1,13 @@
 import re
 import math
-from core.base_tool import BaseTool
+from core.base_tool import BaseTool, AnswerSufficiency
 from typing import Any, Dict
 
+# Words that may surround a bare arithmetic question without changing what is asked
+FILLER_PATTERN = re.compile(r"\b(what is|what's|whats|calculate|compute|evaluate|the value of|value of|please|equals?)\b|[?=]")
+ARITHMETIC_PATTERN = re.compile(r'^[\d\s+\-*/^().,]*\d[\d\s+\-*/^().,]*$')
+RESULT_PATTERN = re.compile(r'^.+ = -?\d+(\.\d+)?(e[+-]?\d+)?$')
+
 class CalculatorTool(BaseTool):
     def __init__(self):
         super().__init__("calculator", "Performs mathematical calculations and evaluates expressions")
@@ -40,6 +45,19 @@ class CalculatorTool(BaseTool):
             error_details = traceback.format_exc()
             return f"Calculation error: {str(e)}"
     
+    def answer_sufficiency(self, query: str, result: Any) -> AnswerSufficiency:
+        result = str(result)
+        if result.startswith(("Calculation error", "No expression", "Could not")):
+            return AnswerSufficiency.NONE
+        # Only bare arithmetic is fully answered by the number; anything else needs context
+        bare = FILLER_PATTERN.sub(" ", query.lower())
+        if RESULT_PATTERN.match(result) and ARITHMETIC_PATTERN.match(bare):
+            return AnswerSufficiency.COMPLETE
+        return AnswerSufficiency.PARTIAL
+    
+    def format_answer(self, result: Any) -> str:
+        return f"**Result:** {result}"
+    
     def _clean_expression(self, expr: str) -> str:
         # Extract mathematical expressions from natural language
         # Specific handling for common patterns
@@ -1,6 +1,6 @@
 import sympy as sp
 import re
-from core.base_tool import BaseTool
+from core.base_tool import BaseTool, AnswerSufficiency
 from typing import Any, Dict
 
 class EquationSolverTool(BaseTool):
@@ -18,8 +18,8 @@ class EquationSolverTool(BaseTool):
             if self._is_simple_linear(cleaned_equation):
                 return self._solve_simple_linear(cleaned_equation)
                 
-            # Use sympy for more complex equations
-            solution = self._solve_equation(cleaned_equation)
+            # Use sympy for more complex equations, off the event loop
+            solution = await self.run_blocking(self._solve_equation, cleaned_equation)
             return solution
             
         except Exception as e:
@@ -27,6 +27,15 @@ class EquationSolverTool(BaseTool):
             error_details = traceback.format_exc()
             return f"Equation solving error: {str(e)}"
     
+    def answer_sufficiency(self, query: str, result: Any) -> AnswerSufficiency:
+        result = str(result)
+        # A solved value comes with its steps, which cover the working unless an explanation was asked for
+        if "x =" in result:
+            return AnswerSufficiency.PARTIAL if self.wants_explanation(query) else AnswerSufficiency.COMPLETE
+        if result.startswith(("Equation solving error", "Could not solve", "No solution")):
+            return AnswerSufficiency.NONE
+        return AnswerSufficiency.PARTIAL
+    
     def _clean_equation(self, equation: str) -> str:
         """Extract and clean the equation from the input text"""
         # Remove common prefixes
@@ -2,14 +2,14 @@ import numpy as np
 import plotly.graph_objects as go
 import plotly.express as px
 from plotly.utils import PlotlyJSONEncoder
-import json
 import re
-from core.base_tool import BaseTool
+from core.base_tool import BaseTool, AnswerSufficiency
+from core.tracing import tracer
 from typing import Any, Dict
 
 class GraphingTool(BaseTool):
     def __init__(self):
-        super().__init__("graphing", "Creates interactive graphs and visualizations for mathematical functions")
+        super().__init__("graphing", "Creates interactive graphs and visualizations for mathematical functions", timeout=10.0)
     
     async def execute(self, **kwargs) -> Any:
         function = kwargs.get('function', '')
@@ -19,11 +19,11 @@ class GraphingTool(BaseTool):
             # Clean the function string to extract the actual function
             clean_function = self._clean_function(function)
             
-            # Create the appropriate graph
+            # Create the appropriate graph; numpy evaluation and JSON serialization run off the event loop
             if plot_type == '3d' or 'z' in function.lower() or any(term in function.lower() for term in ['3d', 'surface', 'contour']):
-                return self._create_3d_graph(clean_function)
+                return await self.run_blocking(self._create_3d_graph, clean_function)
             else:
-                return self._create_2d_graph(clean_function)
+                return await self.run_blocking(self._create_2d_graph, clean_function)
                 
         except Exception as e:
             import traceback
@@ -99,7 +99,7 @@ class GraphingTool(BaseTool):
             )
             
             # Serialize to JSON
-            return f'<plotly-graph>{json.dumps(fig.to_dict())}</plotly-graph>'
+            return self._serialize(fig)
             
         except Exception as e:
             return f"Could not plot function: {str(e)}"
@@ -140,11 +140,22 @@ class GraphingTool(BaseTool):
             )
             
             # Serialize to JSON
-            return f'<plotly-graph>{json.dumps(fig.to_dict())}</plotly-graph>'
+            return self._serialize(fig)
             
         except Exception as e:
             return f"Could not generate 3D plot: {str(e)}"
     
+    def _serialize(self, fig) -> str:
+        with tracer.span("graph.serialize") as span:
+            # Plotly's encoder handles the numpy arrays in the traces; json.dumps does not
+            payload = fig.to_json()
+            span.set_attribute("bytes", len(payload))
+        return f'<plotly-graph>{payload}</plotly-graph>'
+    
+    def answer_sufficiency(self, query: str, result: Any) -> AnswerSufficiency:
+        # A figure always goes out with some explanation; anything else is an error message
+        return AnswerSufficiency.PARTIAL if "<plotly-graph>" in str(result) else AnswerSufficiency.NONE
+    
     def get_schema(self) -> Dict[str, Any]:
         return {
             "name": self.name,
@@ -1,6 +1,6 @@
 import math
 import re
-from core.base_tool import BaseTool
+from core.base_tool import BaseTool, AnswerSufficiency
 from typing import Any, Dict
 
 class PhysicsCalculatorTool(BaseTool):
@@ -53,6 +53,19 @@ class PhysicsCalculatorTool(BaseTool):
             # Return user-friendly error instead of technical details
             return "I couldn't calculate that. Please check if all needed values are provided."
     
+    def answer_sufficiency(self, query: str, result: Any) -> AnswerSufficiency:
+        result = str(result)
+        if result.startswith(("Could not", "Please", "I couldn't", "Found values")):
+            return AnswerSufficiency.NONE
+        # Formula results end in "= <number> <unit>" on every line
+        lines = result.splitlines()
+        if all(re.search(r'= -?[\d.]+(e[+-]?\d+)? \S+$', line) for line in lines) and not self.wants_explanation(query):
+            return AnswerSufficiency.COMPLETE
+        return AnswerSufficiency.PARTIAL
+    
+    def format_answer(self, result: Any) -> str:
+        return f"**Calculation:**\n{result}"
+    
     def _solve_physics_problem(self, problem: str) -> str:
         problem_lower = problem.lower()
         
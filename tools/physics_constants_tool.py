@@ -1,5 +1,5 @@
 import json
-from core.base_tool import BaseTool
+from core.base_tool import BaseTool, AnswerSufficiency
 from typing import Any, Dict
 
 class PhysicsConstantsTool(BaseTool):
@@ -127,6 +127,18 @@ class PhysicsConstantsTool(BaseTool):
         except Exception as e:
             return f"Constants lookup error: {str(e)}"
     
+    def answer_sufficiency(self, query: str, result: Any) -> AnswerSufficiency:
+        result = str(result)
+        if not result.startswith("**Physics Constants Found:**"):
+            return AnswerSufficiency.NONE
+        # A single unambiguous constant is the answer to a lookup
+        if result.count("Value:") == 1 and not self.wants_explanation(query):
+            return AnswerSufficiency.COMPLETE
+        return AnswerSufficiency.PARTIAL
+    
+    def format_answer(self, result: Any) -> str:
+        return str(result).replace("**Physics Constants Found:**\n\n", "").strip()
+    
     def get_schema(self) -> Dict[str, Any]:
         return {
             "name": self.name,
@@ -1,5 +1,5 @@
 import re
-from core.base_tool import BaseTool
+from core.base_tool import BaseTool, AnswerSufficiency
 from typing import Any, Dict
 
 class UnitConverterTool(BaseTool):
@@ -61,6 +61,17 @@ class UnitConverterTool(BaseTool):
         except Exception as e:
             return f"Unit conversion error: {str(e)}"
     
+    def answer_sufficiency(self, query: str, result: Any) -> AnswerSufficiency:
+        result = str(result)
+        if result.startswith(("Could not parse", "Unit conversion error", "Unknown unit")):
+            return AnswerSufficiency.NONE
+        if re.match(r'^-?[\d.]+\s*°?\w+ = ', result) and not self.wants_explanation(query):
+            return AnswerSufficiency.COMPLETE
+        return AnswerSufficiency.PARTIAL
+    
+    def format_answer(self, result: Any) -> str:
+        return f"**Conversion:** {result}"
+    
     def _parse_and_convert(self, query: str) -> str:
         # Pattern: "convert X unit1 to unit2" or "X unit1 to unit2"
         patterns = [
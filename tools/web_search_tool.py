@@ -1,11 +1,11 @@
 import requests
 from bs4 import BeautifulSoup
-from core.base_tool import BaseTool
+from core.base_tool import BaseTool, AnswerSufficiency
 from typing import Any, Dict, List
 
 class WebSearchTool(BaseTool):
     def __init__(self):
-        super().__init__("web_search", "Searches the web for current information and educational content")
+        super().__init__("web_search", "Searches the web for current information and educational content", timeout=12.0)
     
     async def execute(self, **kwargs) -> Any:
         query = kwargs.get('query', '')
@@ -13,7 +13,7 @@ class WebSearchTool(BaseTool):
         
         try:
             # Use DuckDuckGo search (no API key required)
-            search_results = self._search_duckduckgo(query, max_results)
+            search_results = await self.run_blocking(self._search_duckduckgo, query, max_results)
             
             if search_results:
                 formatted_results = []
@@ -27,6 +27,11 @@ class WebSearchTool(BaseTool):
         except Exception as e:
             return f"Search error: {str(e)}"
     
+    def answer_sufficiency(self, query: str, result: Any) -> AnswerSufficiency:
+        if str(result).startswith(("No search results", "Search error")):
+            return AnswerSufficiency.NONE
+        return AnswerSufficiency.PARTIAL
+    
     def _search_duckduckgo(self, query: str, max_results: int) -> List[Dict[str, str]]:
         try:
             # DuckDuckGo instant search